@@ -0,0 +1,262 @@
+"""Нагрузочный прогон обоих сервисов: смешанный сценарий, p50/p95/p99 и RPS по каждой ручке.
+
+Сервисы запускаются в этом процессе (ASGITransport, по умолчанию) или как отдельные
+процессы uvicorn (--target uvicorn), БД - из настроек окружения (локальный Postgres).
+
+Запуск:
+    set -a; . ./env.dev; set +a
+    python -m benchmarks.load --concurrency 20 --duration 30 --save benchmarks/baselines/local.json
+    python -m benchmarks.load --compare benchmarks/baselines/local.json
+
+С --compare процесс завершается с кодом 1, если p95 какой-то ручки вырос больше чем на --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager, AsyncExitStack
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import AsyncIterator
+
+import httpx
+
+ROUTES = ('register', 'token', 'me', 'transaction/create', 'transaction/history')
+# share of each route in the mixed workload
+DEFAULT_MIX = {'register': 1, 'token': 2, 'me': 10, 'transaction/create': 5, 'transaction/history': 10}
+PASSWORD = 'bench-password'
+
+
+@dataclass
+class RouteStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        return dict(
+            count=len(latencies),
+            errors=self.errors,
+            rps=round(len(latencies) / elapsed, 1),
+            p50_ms=round(percentile(latencies, 50) * 1000, 2),
+            p95_ms=round(percentile(latencies, 95) * 1000, 2),
+            p99_ms=round(percentile(latencies, 99) * 1000, 2),
+        )
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(p / 100 * len(sorted_values) + 0.5))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+@dataclass
+class Account:
+    id: str
+    username: str
+    token: str
+
+
+class Workload:
+    def __init__(self, auth: httpx.AsyncClient, trans: httpx.AsyncClient, mix: dict[str, int]):
+        self.auth = auth
+        self.trans = trans
+        self.routes = list(mix)
+        self.weights = list(mix.values())
+        self.accounts: list[Account] = []
+        self.stats: dict[str, RouteStats] = defaultdict(RouteStats)
+
+    async def register(self) -> Account | None:
+        username = f'bench {uuid.uuid4()}'
+        response = await self.auth.post('/register', json=dict(username=username, password=PASSWORD))
+        if response.status_code != 201:
+            return None
+        return Account(response.json()['id'], username, '')
+
+    async def login(self, account: Account) -> httpx.Response:
+        response = await self.auth.post('/token', data=dict(username=account.username, password=PASSWORD))
+        if response.status_code == 200:
+            account.token = response.json()['access_token']
+        return response
+
+    async def setup(self, users: int):
+        for account in await asyncio.gather(*(self.register() for _ in range(users))):
+            if account is not None:
+                await self.login(account)
+                self.accounts.append(account)
+        if len(self.accounts) < 2:
+            raise RuntimeError('Cannot register benchmark users, is the database migrated?')
+
+    async def step(self, route: str) -> httpx.Response | None:
+        account = random.choice(self.accounts)
+        headers = {'Authorization': f'Bearer {account.token}'}
+        if route == 'register':
+            new = await self.register()
+            if new is not None:
+                await self.login(new)
+                self.accounts.append(new)
+            return None
+        if route == 'token':
+            return await self.login(account)
+        if route == 'me':
+            return await self.auth.get('/me', headers=headers)
+        if route == 'transaction/create':
+            to = random.choice(self.accounts)
+            data = dict(to_user_id=to.id, amount=str(Decimal(random.randrange(1, 100)) / 100))
+            return await self.trans.post('/transaction/create', json=data, headers=headers)
+        return await self.trans.get(
+            '/transaction/history', params=dict(page=random.randint(1, 3)), headers=headers
+        )
+
+    async def run_one(self, route: str):
+        start = time.perf_counter()
+        try:
+            response = await self.step(route)
+            ok = response is None or response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        elapsed = time.perf_counter() - start
+        if ok:
+            self.stats[route].latencies.append(elapsed)
+        else:
+            self.stats[route].errors += 1
+
+    async def run(self, concurrency: int, duration: float, requests: int | None) -> float:
+        deadline = time.perf_counter() + duration
+        remaining = requests
+
+        async def user():
+            nonlocal remaining
+            while time.perf_counter() < deadline:
+                if remaining is not None:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                await self.run_one(random.choices(self.routes, self.weights)[0])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+@asynccontextmanager
+async def asgi_clients() -> AsyncIterator[tuple[httpx.AsyncClient, httpx.AsyncClient]]:
+    from src.authorization.web import app as auth_app
+    from src.transaction.web import app as trans_app
+
+    async with AsyncExitStack() as stack:
+        clients = []
+        for app, base_url in ((auth_app, 'http://auth'), (trans_app, 'http://trans')):
+            # ASGITransport does not run the lifespan (settlement worker, hasher shutdown)
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            clients.append(await stack.enter_async_context(
+                httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=base_url, timeout=60)
+            ))
+        yield tuple(clients)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def uvicorn_clients(workers: int) -> AsyncIterator[tuple[httpx.AsyncClient, httpx.AsyncClient]]:
+    processes, clients = [], []
+    try:
+        for app in ('src.authorization.web:app', 'src.transaction.web:app'):
+            port = _free_port()
+            processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'uvicorn', app, '--port', str(port), '--workers', str(workers),
+                 '--log-level', 'warning'],
+            ))
+            client = httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', timeout=60)
+            clients.append(client)
+            for _ in range(100):
+                try:
+                    await client.get('/docs')
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError(f'{app} did not start')
+        yield tuple(clients)
+    finally:
+        for client in clients:
+            await client.aclose()
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Ручки, у которых p95 хуже базового больше чем на tolerance (доля)"""
+    regressions = []
+    for route, stats in result['routes'].items():
+        base = baseline['routes'].get(route)
+        if base and base['p95_ms'] and stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {base['p95_ms']} -> {stats['p95_ms']} ms")
+    return regressions
+
+
+async def main(args: argparse.Namespace):
+    mix = {route: weight for route, weight in DEFAULT_MIX.items() if route in args.routes}
+    clients = asgi_clients() if args.target == 'asgi' else uvicorn_clients(args.workers)
+    async with clients as (auth, trans):
+        workload = Workload(auth, trans, mix)
+        await workload.setup(args.users)
+        elapsed = await workload.run(args.concurrency, args.duration, args.requests)
+    result = dict(
+        meta=dict(
+            date=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            target=args.target,
+            concurrency=args.concurrency,
+            duration_s=round(elapsed, 2),
+            users=args.users,
+            mix=mix,
+            python=platform.python_version(),
+            cpus=os.cpu_count(),
+        ),
+        routes={route: workload.stats[route].summary(elapsed) for route in mix},
+    )
+    print(f"{'route':22} {'count':>7} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, s in result['routes'].items():
+        print(f"{route:22} {s['count']:7} {s['errors']:6} {s['rps']:8} {s['p50_ms']:8} {s['p95_ms']:8} {s['p99_ms']:8}")
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print('REGRESSION', line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=('asgi', 'uvicorn'), default='asgi')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers per service')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--requests', type=int, default=None, help='stop after this many requests')
+    parser.add_argument('--users', type=int, default=20, help='users registered before the run')
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--save', help='write the result as a JSON baseline')
+    parser.add_argument('--compare', help='JSON baseline to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 growth, 0.2 = 20%%')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""Накладные расходы LoggerMiddleware: BaseHTTPMiddleware (до) против чистого ASGI (после).
+
+Запросы идут в оба сервиса через ASGITransport на служебный маршрут без обращений к БД,
+поэтому разница во времени — это в основном стоимость middleware.
+
+Запуск: `set -a; . ./env.dev; set +a; python -m benchmarks.middleware`
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Coroutine
+
+import httpx
+import jwt
+from fastapi import FastAPI
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src.authorization.web import create_app as create_auth_app
+from src.logconf import LoggerMiddleware, _extra
+from src.settings import settings
+from src.transaction.web import create_app as create_trans_app
+
+
+class LegacyLoggerMiddleware(BaseHTTPMiddleware):
+    """LoggerMiddleware до перехода на ASGI (второе декодирование JWT без проверки подписи)"""
+
+    async def dispatch(
+            self,
+            request: Request,
+            call_next: Callable[[Request], Coroutine[Any, Any, Response]],
+    ) -> Response:
+        request_id: str = request.headers.get('X-Request-ID') or str(uuid.uuid4())
+        try:
+            user_id = jwt.decode(
+                request.headers.get('Authorization', 'Bearer ..')[len('Bearer '):],
+                options={"verify_signature": False}).get('sub', 'unknown')
+        except jwt.PyJWTError:
+            user_id = 'unknown'
+        _extra.set(dict(request_id=request_id, user_id=user_id))
+        return await call_next(request)
+
+
+def build_app(create_app: Callable[[], FastAPI], middleware: type) -> FastAPI:
+    app = create_app()
+    app.user_middleware = [Middleware(middleware)]
+    app.middleware_stack = None
+    return app
+
+
+async def run(app: FastAPI, token: str, requests: int, concurrency: int) -> float:
+    headers = {'Authorization': f'Bearer {token}'}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+        await client.get('/stats/auth-cache', headers=headers)
+
+        async def worker(count: int):
+            for _ in range(count):
+                response = await client.get('/stats/auth-cache', headers=headers)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+async def main(requests: int, concurrency: int):
+    now = datetime.now(timezone.utc)
+    token = jwt.encode(
+        dict(sub=str(uuid.uuid4()), username='bench', created=now.isoformat(), exp=now + timedelta(hours=1)),
+        settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM,
+    )
+    for name, create_app in (('auth', create_auth_app), ('transaction', create_trans_app)):
+        for label, middleware in (('BaseHTTPMiddleware', LegacyLoggerMiddleware), ('ASGI', LoggerMiddleware)):
+            rps = await run(build_app(create_app, middleware), token, requests, concurrency)
+            print(f'{name:12} {label:20} {rps:10.0f} req/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
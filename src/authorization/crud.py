@@ -8,9 +8,10 @@ from src.authorization import logger
 from src.authorization.utils import get_password_hash
 from src.database.models import User
 from src.schemas import UserSchema
+from src.utils import principal_cache
 
 async def create_user(session: AsyncSession, username: str, password: str) -> UserSchema | None:
-    hashed_password = get_password_hash(password)
+    hashed_password = await get_password_hash(password)
     user = User(id=uuid.uuid4(), fullname=username, hashed_password=hashed_password, balance=1000.0)
     user_schema = UserSchema.model_construct(**user.as_dict())
     session.add(user)
@@ -22,8 +23,9 @@ async def create_user(session: AsyncSession, username: str, password: str) -> Us
         await session.rollback()
 
 async def change_user_password(session: AsyncSession, user_id: uuid.UUID, new_password: str):
-    hashed_password = get_password_hash(new_password)
+    hashed_password = await get_password_hash(new_password)
     stmt = update(User).where(User.id == user_id).values(hashed_password=hashed_password, password_set_time=func.now())
     await session.execute(stmt)
     await session.commit()
+    principal_cache.pop(user_id)
     logger.info('User changed his passowrd')
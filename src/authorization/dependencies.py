@@ -2,7 +2,7 @@ from datetime import timedelta, datetime, timezone
 from typing import Annotated
 
 import jwt
-from fastapi import Depends
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -13,7 +13,7 @@ from src.crud import get_user
 from src.database.connection import get_async_session
 from src.database.models import User
 from src.settings import settings
-from src.utils import credentials_exception, decode_payload
+from src.utils import authenticate_token_user, request_token_payload
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -24,7 +24,7 @@ async def authenticate_user(
     user = await get_user(session, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -42,14 +42,12 @@ def create_access_token(
 
 
 async def get_current_user(
+        request: Request,
         session: Annotated[AsyncSession, Depends(get_async_session)],
         token: Annotated[str, Depends(oauth2_scheme)]
 ) -> User:
-    payload_schema = await decode_payload(token)
-    if payload_schema is None:
-        raise credentials_exception
-    user = await get_user(session, payload_schema.sub)
-    if user is None or user.password_set_time.replace(tzinfo=timezone.utc) > payload_schema.created:
+    try:
+        return await authenticate_token_user(session, token, await request_token_payload(request, token))
+    except HTTPException:
         logger.error('User not exists or password changed')
-        raise credentials_exception
-    return user
+        raise
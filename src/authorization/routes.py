@@ -93,7 +93,7 @@ async def change_user_password(
     - :body **old_password** - старый пароль
     - :body **new_password** - новый пароль
     """
-    if not verify_password(old_password, current_user.hashed_password):
+    if not await verify_password(old_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Incorrect username or password',
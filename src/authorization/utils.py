@@ -1,11 +1,125 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Callable, Literal, TypeVar
+
+from fastapi import HTTPException
 from passlib.context import CryptContext
+from prometheus_client import REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from starlette import status
+
+from src.metrics import PASSWORD_HASH_LATENCY
+from src.settings import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+T = TypeVar('T')
+
+hasher_overloaded_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail='Too many authentication requests, try later',
+    headers={'Retry-After': '1'},
+)
+
 
-def verify_password(plain_password, hashed_password):
+def _verify(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password):
+def _hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+@dataclass
+class HasherStats:
+    calls: int = 0
+    rejected: int = 0
+    in_flight: int = 0
+    total_time: float = 0.0  # seconds, including waiting for a free worker
+    max_time: float = 0.0
+
+    @property
+    def avg_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+class PasswordHasher:
+    """Выполняет bcrypt в пуле потоков/процессов, не блокируя event loop.
+
+    Если в работе уже max_pending вызовов, новые отклоняются с 503.
+    """
+
+    def __init__(self, executor: Literal['thread', 'process'], workers: int, max_pending: int):
+        self.executor_kind = executor
+        self.workers = workers
+        self.max_pending = max_pending
+        self.stats = HasherStats()
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        operation = 'verify' if func is _verify else 'hash'
+        if self.stats.in_flight >= self.max_pending:
+            self.stats.rejected += 1
+            raise hasher_overloaded_exception
+        self.stats.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.in_flight -= 1
+            self.stats.calls += 1
+            self.stats.total_time += elapsed
+            self.stats.max_time = max(self.stats.max_time, elapsed)
+            PASSWORD_HASH_LATENCY.labels(operation).observe(elapsed)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    def snapshot(self) -> HasherStats:
+        return replace(self.stats)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+class HasherCollector(Collector):
+    def collect(self):
+        stats = password_hasher.stats
+        yield CounterMetricFamily('password_hash_rejected', 'Отклонено вызовов bcrypt (503)', value=stats.rejected)
+        yield GaugeMetricFamily('password_hash_in_flight', 'Вызовов bcrypt в работе и в очереди', value=stats.in_flight)
+
+
+password_hasher = PasswordHasher(
+    settings.HASHER_EXECUTOR,
+    settings.HASHER_WORKERS,
+    settings.HASHER_MAX_PENDING
+)
+
+
+REGISTRY.register(HasherCollector())
+
+
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
@@ -1,12 +1,25 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from src.authorization.routes import router
+from src.authorization.utils import password_hasher
 from src.logconf import LoggerMiddleware
+from src.metrics import MetricsMiddleware
+from src.routes import service_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    password_hasher.shutdown()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     app.include_router(router)
+    app.include_router(service_router)
+    app.add_middleware(MetricsMiddleware)
     app.add_middleware(LoggerMiddleware)
     return app
 
-app = create_app()
\ No newline at end of file
+app = create_app()
@@ -1,9 +1,12 @@
 import uuid
+from decimal import Decimal
+from typing import Iterable
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
+from src.schemas import PrincipalSchema
 
 
 async def get_user(
@@ -17,4 +20,23 @@ async def get_user(
     else:
         return
     user = (await session.scalars(stmt)).first()
-    return user
\ No newline at end of file
+    return user
+
+
+async def get_principal(
+        session: AsyncSession,
+        user_id: uuid.UUID
+) -> PrincipalSchema | None:
+    stmt = select(User.id, User.fullname, User.password_set_time).where(User.id == user_id)
+    row = (await session.execute(stmt)).first()
+    if row is not None:
+        return PrincipalSchema.model_construct(**row._asdict())
+
+
+async def get_balances(
+        session: AsyncSession,
+        ids: Iterable[uuid.UUID]
+) -> dict[uuid.UUID, Decimal]:
+    """Балансы существующих пользователей из ids"""
+    stmt = select(User.id, User.balance).where(User.id.in_(set(ids)))
+    return dict((await session.execute(stmt)).all())
@@ -1,11 +1,53 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import time
 
-from src.settings import settings
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-engine = create_async_engine(settings.db_url, echo=True)
+from src.metrics import DB_POOL_CHECKOUT_WAIT
+from src.settings import settings, Settings
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий ожидание соединения (включая открытие нового при переполнении)"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+def create_engine(settings: Settings) -> AsyncEngine:
+    """Движок с параметрами пула из настроек (общий для обоих сервисов)"""
+    return create_async_engine(settings.db_url, poolclass=TimedQueuePool, **settings.engine_options)
+
+
+engine = create_engine(settings)
+
+
+class PoolCollector(Collector):
+    def collect(self):
+        pool = engine.pool
+        metric = GaugeMetricFamily('db_pool_connections', 'Соединения пула', labels=['state'])
+        metric.add_metric(['checked_out'], pool.checkedout())
+        metric.add_metric(['idle'], pool.checkedin())
+        metric.add_metric(['overflow'], max(pool.overflow(), 0))
+        yield metric
+
+
+REGISTRY.register(PoolCollector())
 SessionMaker = async_sessionmaker(engine)
 
 
 async def get_async_session():
     async with SessionMaker() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def get_session_maker() -> async_sessionmaker[AsyncSession]:
+    """Для кода, который живёт дольше запроса (например, потоковые ответы) и открывает сессии сам"""
+    return SessionMaker
@@ -59,3 +59,103 @@ class Transaction(Base):
     to_user_id: Mapped[uuid.UUID] = mapped_column(sa.ForeignKey('users.id', ondelete='SET NULL'))
     amount: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
     status: Mapped[TransactionStatus] = mapped_column(nullable=False, default=TransactionStatus.CREATED)
+    claimed_at: Mapped[datetime | None] = mapped_column(nullable=True) # when a worker took it for processing
+
+# history pages of a user are read newest first, separately for outgoing and incoming transfers
+sa.Index(
+    'ix_transactions_from_user_id_dt',
+    Transaction.from_user_id, Transaction.dt.desc(), Transaction.id.desc(),
+    postgresql_include=['amount', 'status']
+)
+sa.Index(
+    'ix_transactions_to_user_id_dt',
+    Transaction.to_user_id, Transaction.dt.desc(), Transaction.id.desc(),
+    postgresql_include=['amount', 'status']
+)
+# settlement workers claim unprocessed transactions in id order
+sa.Index(
+    'ix_transactions_pending',
+    Transaction.id,
+    postgresql_where=Transaction.status.in_((TransactionStatus.CREATED, TransactionStatus.PROCESSED))
+)
+
+
+class UserTransactionCounter(Base):
+    """Количество строк истории пользователя: по направлению и по статусу.
+
+    Поддерживается триггерами на transactions (см. ниже), поэтому меняется в той же
+    транзакции БД, что и вставка/проведение, при любом способе записи.
+    """
+    __tablename__ = 'user_transaction_counters'
+    user_id: Mapped[uuid.UUID] = mapped_column(sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    outgoing: Mapped[int] = mapped_column(sa.BigInteger, nullable=False, default=0)
+    incoming: Mapped[int] = mapped_column(sa.BigInteger, nullable=False, default=0)
+    created: Mapped[int] = mapped_column(sa.BigInteger, nullable=False, default=0)
+    processed: Mapped[int] = mapped_column(sa.BigInteger, nullable=False, default=0)
+    done: Mapped[int] = mapped_column(sa.BigInteger, nullable=False, default=0)
+    canceled: Mapped[int] = mapped_column(sa.BigInteger, nullable=False, default=0)
+
+
+def _counter_deltas(table: str, sign: int) -> str:
+    return f"""
+        SELECT from_user_id AS user_id, 'outcome' AS direction, status, {sign} AS sign FROM {table}
+        UNION ALL
+        SELECT to_user_id, 'income', status, {sign} FROM {table}"""
+
+
+def counters_upsert_sql(deltas: str) -> str:
+    """Прибавляет к счётчикам строки deltas (user_id, direction, status, sign)"""
+    return f"""
+    INSERT INTO user_transaction_counters AS c (user_id, outgoing, incoming, created, processed, done, canceled)
+    SELECT * FROM (
+        SELECT d.user_id,
+               coalesce(sum(sign) FILTER (WHERE direction = 'outcome'), 0),
+               coalesce(sum(sign) FILTER (WHERE direction = 'income'), 0),
+               coalesce(sum(sign) FILTER (WHERE status = 'CREATED'), 0),
+               coalesce(sum(sign) FILTER (WHERE status = 'PROCESSED'), 0),
+               coalesce(sum(sign) FILTER (WHERE status = 'DONE'), 0),
+               coalesce(sum(sign) FILTER (WHERE status = 'CANCELED'), 0)
+        FROM ({deltas}) d
+        -- users being deleted are skipped, their counters go away with them
+        JOIN users u ON u.id = d.user_id
+        GROUP BY d.user_id
+    ) g (user_id, outgoing, incoming, created, processed, done, canceled)
+    WHERE (outgoing, incoming, created, processed, done, canceled) <> (0, 0, 0, 0, 0, 0)
+    ORDER BY user_id  -- the same lock order in concurrent transactions
+    ON CONFLICT (user_id) DO UPDATE SET
+        outgoing = c.outgoing + excluded.outgoing,
+        incoming = c.incoming + excluded.incoming,
+        created = c.created + excluded.created,
+        processed = c.processed + excluded.processed,
+        done = c.done + excluded.done,
+        canceled = c.canceled + excluded.canceled"""
+
+
+# statement level triggers: a multi-row insert or update touches each counter row once
+COUNTERS_TRIGGER_DDL = (
+    f"""
+    CREATE OR REPLACE FUNCTION count_user_transactions() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {counters_upsert_sql(_counter_deltas('new_rows', 1))};
+        ELSIF TG_OP = 'UPDATE' THEN
+            {counters_upsert_sql(_counter_deltas('new_rows', 1) + ' UNION ALL ' + _counter_deltas('old_rows', -1))};
+        ELSE
+            {counters_upsert_sql(_counter_deltas('old_rows', -1))};
+        END IF;
+        RETURN NULL;
+    END $$""",
+    """
+    CREATE OR REPLACE TRIGGER transactions_count_insert AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION count_user_transactions()""",
+    """
+    CREATE OR REPLACE TRIGGER transactions_count_update AFTER UPDATE ON transactions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_user_transactions()""",
+    """
+    CREATE OR REPLACE TRIGGER transactions_count_delete AFTER DELETE ON transactions
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION count_user_transactions()""",
+)
+
+for _ddl in COUNTERS_TRIGGER_DDL:
+    sa.event.listen(Base.metadata, 'after_create', sa.DDL(_ddl).execute_if(dialect='postgresql'))
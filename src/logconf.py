@@ -1,35 +1,44 @@
 import contextvars
 import logging.config
 import uuid
-from typing import Callable, Coroutine, Any
 
-import jwt
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Scope, Receive, Send
+
+from src.settings import settings
+from src.utils import decode_payload
 
 _extra = contextvars.ContextVar('extra')
 
 LOGLEVEL = logging.INFO
 
-class LoggerMiddleware(BaseHTTPMiddleware):
-    """Добавляет экстра инфу для логирования"""
+class LoggerMiddleware:
+    """Добавляет экстра инфу для логирования.
+
+    Чистый ASGI middleware: не оборачивает ответ, поэтому не мешает потоковым ответам.
+    Проверенный payload токена кладётся в request.state.token_payload (пара токен, payload),
+    чтобы зависимости авторизации не декодировали токен второй раз.
+    """
 
-    async def dispatch(
-            self,
-            request: Request,
-            call_next: Callable[[Request], Coroutine[Any, Any, Response]],
-    ) -> Response:
-        request_id: str = request.headers.get('X-Request-ID') or str(uuid.uuid4())
-        try:
-            user_id = jwt.decode(
-                request.headers.get('Authorization', 'Bearer ..')[len('Bearer '):],
-                options={"verify_signature": False}).get('sub', 'unknown')
-        except jwt.PyJWTError:
-            user_id = 'unknown'
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        request_id: str = headers.get('X-Request-ID') or str(uuid.uuid4())
+        user_id = 'unknown'
+        scheme, token = get_authorization_scheme_param(headers.get('Authorization'))
+        if token and scheme.lower() == 'bearer':
+            payload_schema = await decode_payload(token)
+            scope.setdefault('state', {})['token_payload'] = (token, payload_schema)
+            if payload_schema is not None:
+                user_id = str(payload_schema.sub)
         _extra.set(dict(request_id=request_id, user_id=user_id))
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
 
 class InjectingFilter(logging.Filter):
     """
@@ -70,7 +79,8 @@ LOGGING_CONFIG = {
         },
         'sqlalchemy': {
             'handlers': ['console'],
-            'level': LOGLEVEL
+            # statements are logged at INFO, only when DB_ECHO is on
+            'level': LOGLEVEL if settings.DB_ECHO else logging.WARNING
         },
         'passlib': {
             'handlers': ['console'],
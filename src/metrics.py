@@ -0,0 +1,83 @@
+import time
+
+from prometheus_client import Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from src.utils import auth_cache_stats
+
+# Metrics are updated in the request path, so only histograms live here: an observation is
+# a bucket search and two increments under an uncontended lock. Everything that already
+# has a counter somewhere (caches, hasher, pool, worker) is read by collectors at scrape time.
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Время обработки запроса (до отправки последнего куска тела)',
+    ['method', 'route', 'status'],
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Ожидание свободного соединения в пуле',
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+)
+PASSWORD_HASH_LATENCY = Histogram(
+    'password_hash_duration_seconds',
+    'Время bcrypt вместе с ожиданием свободного исполнителя',
+    ['operation'],
+    buckets=(.01, .025, .05, .1, .2, .3, .5, .75, 1, 2.5, 5, 10),
+)
+TRANSACTION_STATUS_DWELL = Histogram(
+    'transaction_status_dwell_seconds',
+    'Сколько транзакция провела в статусе до проведения',
+    ['status'],
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+
+
+class MetricsMiddleware:
+    """Гистограмма времени ответа по шаблону маршрута (чистый ASGI)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the route template keeps the label set small, unmatched paths share one label
+            route = scope.get('route')
+            REQUEST_LATENCY.labels(
+                scope['method'], route.path if route is not None else 'unmatched', str(status_code)
+            ).observe(time.perf_counter() - start)
+
+
+class AuthCacheCollector(Collector):
+    def collect(self):
+        hits = CounterMetricFamily('auth_cache_hits', 'Попадания в кэши аутентификации', labels=['cache'])
+        misses = CounterMetricFamily('auth_cache_misses', 'Промахи кэшей аутентификации', labels=['cache'])
+        size = GaugeMetricFamily('auth_cache_size', 'Записей в кэшах аутентификации', labels=['cache'])
+        for name, stats in auth_cache_stats().items():
+            hits.add_metric([name], stats['hits'])
+            misses.add_metric([name], stats['misses'])
+            size.add_metric([name], stats['size'])
+        yield from (hits, misses, size)
+
+
+REGISTRY.register(AuthCacheCollector())
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,43 @@
+"""add transactions history indexes
+
+Revision ID: 10619601f127
+Revises: adebfc4691e6
+Create Date: 2026-10-17 10:00:12.417305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '10619601f127'
+down_revision: Union[str, None] = 'adebfc4691e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for column in ('from_user_id', 'to_user_id'):
+            op.create_index(
+                f'ix_transactions_{column}_dt',
+                'transactions',
+                [column, sa.text('dt DESC'), sa.text('id DESC')],
+                postgresql_include=['amount', 'status'],
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for column in ('from_user_id', 'to_user_id'):
+            op.drop_index(
+                f'ix_transactions_{column}_dt',
+                table_name='transactions',
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -0,0 +1,42 @@
+"""add transaction claimed_at
+
+Revision ID: 5d1c0e7a9b42
+Revises: 10619601f127
+Create Date: 2026-10-17 11:30:41.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1c0e7a9b42'
+down_revision: Union[str, None] = '10619601f127'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('transactions', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_pending',
+            'transactions',
+            ['id'],
+            postgresql_where=sa.text("status IN ('CREATED', 'PROCESSED')"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_transactions_pending',
+            table_name='transactions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column('transactions', 'claimed_at')
@@ -0,0 +1,99 @@
+"""add user transaction counters
+
+Revision ID: 7b3e52c9d1f0
+Revises: 5d1c0e7a9b42
+Create Date: 2026-10-17 14:00:27.661093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3e52c9d1f0'
+down_revision: Union[str, None] = '5d1c0e7a9b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _deltas(table: str, sign: int) -> str:
+    return f"""
+        SELECT from_user_id AS user_id, 'outcome' AS direction, status, {sign} AS sign FROM {table}
+        UNION ALL
+        SELECT to_user_id, 'income', status, {sign} FROM {table}"""
+
+
+def _upsert(deltas: str) -> str:
+    return f"""
+    INSERT INTO user_transaction_counters AS c (user_id, outgoing, incoming, created, processed, done, canceled)
+    SELECT * FROM (
+        SELECT d.user_id,
+               coalesce(sum(sign) FILTER (WHERE direction = 'outcome'), 0),
+               coalesce(sum(sign) FILTER (WHERE direction = 'income'), 0),
+               coalesce(sum(sign) FILTER (WHERE status = 'CREATED'), 0),
+               coalesce(sum(sign) FILTER (WHERE status = 'PROCESSED'), 0),
+               coalesce(sum(sign) FILTER (WHERE status = 'DONE'), 0),
+               coalesce(sum(sign) FILTER (WHERE status = 'CANCELED'), 0)
+        FROM ({deltas}) d
+        JOIN users u ON u.id = d.user_id
+        GROUP BY d.user_id
+    ) g (user_id, outgoing, incoming, created, processed, done, canceled)
+    WHERE (outgoing, incoming, created, processed, done, canceled) <> (0, 0, 0, 0, 0, 0)
+    ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        outgoing = c.outgoing + excluded.outgoing,
+        incoming = c.incoming + excluded.incoming,
+        created = c.created + excluded.created,
+        processed = c.processed + excluded.processed,
+        done = c.done + excluded.done,
+        canceled = c.canceled + excluded.canceled"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_transaction_counters',
+        sa.Column('user_id', sa.Uuid(), nullable=False),
+        *(
+            sa.Column(name, sa.BigInteger(), nullable=False)
+            for name in ('outgoing', 'incoming', 'created', 'processed', 'done', 'canceled')
+        ),
+        sa.ForeignKeyConstraint(
+            ['user_id'], ['users.id'],
+            name=op.f('fk_user_transaction_counters_user_id_users'), ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint('user_id', name=op.f('pk_user_transaction_counters'))
+    )
+    op.execute(f"""
+    CREATE OR REPLACE FUNCTION count_user_transactions() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {_upsert(_deltas('new_rows', 1))};
+        ELSIF TG_OP = 'UPDATE' THEN
+            {_upsert(_deltas('new_rows', 1) + ' UNION ALL ' + _deltas('old_rows', -1))};
+        ELSE
+            {_upsert(_deltas('old_rows', -1))};
+        END IF;
+        RETURN NULL;
+    END $$""")
+    # writes wait until the backfill is committed together with the triggers
+    op.execute('LOCK TABLE transactions IN SHARE ROW EXCLUSIVE MODE')
+    op.execute("""
+    CREATE TRIGGER transactions_count_insert AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION count_user_transactions()""")
+    op.execute("""
+    CREATE TRIGGER transactions_count_update AFTER UPDATE ON transactions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_user_transactions()""")
+    op.execute("""
+    CREATE TRIGGER transactions_count_delete AFTER DELETE ON transactions
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION count_user_transactions()""")
+    op.execute(_upsert(_deltas('transactions', 1)))
+
+
+def downgrade() -> None:
+    for trigger in ('insert', 'update', 'delete'):
+        op.execute(f'DROP TRIGGER IF EXISTS transactions_count_{trigger} ON transactions')
+    op.execute('DROP FUNCTION IF EXISTS count_user_transactions()')
+    op.drop_table('user_transaction_counters')
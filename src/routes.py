@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+from starlette.responses import Response
+
+from src.metrics import render_metrics
+from src.utils import auth_cache_stats
+
+service_router = APIRouter(tags=['Служебные'])
+
+
+@service_router.get(
+    '/stats/auth-cache',
+    summary='Статистика кэшей аутентификации'
+)
+async def get_auth_cache_stats():
+    """Размер и количество попаданий/промахов кэшей токенов и пользователей этого процесса"""
+    return auth_cache_stats()
+
+
+@service_router.get(
+    '/metrics',
+    response_class=Response,
+    summary='Метрики в формате Prometheus'
+)
+async def get_metrics():
+    """Время ответов по маршрутам, ожидание пула БД, bcrypt, время транзакций в статусах, кэши"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
@@ -24,6 +24,13 @@ class UserSchema(UserResponceSchema):
     hashed_password: str
 
 
+class PrincipalSchema(BaseModel):
+    """Authenticated user without volatile and secret fields"""
+    id: uuid.UUID
+    fullname: str
+    password_set_time: datetime
+
+
 class JWTPayloadSchema(BaseModel):
     model_config = ConfigDict(extra='allow')
     sub: uuid.UUID
@@ -44,18 +51,32 @@ class TransactionResponceSchema(BaseModel):
     dt: datetime
     status: TransactionStatus
 
+class TransactionBatchResultSchema(BaseModel):
+    transaction: TransactionResponceSchema | None = None
+    error: str | None = None
+
 class TransactionSchema(TransactionCreateSchema, TransactionResponceSchema):
     model_config = ConfigDict(from_attributes=True)
     from_user_id: uuid.UUID
 
 class TransactionPagesCountSchema(BaseModel):
     pages_count: int
-class TransactonHistoryParamsSchema(BaseModel):
-    page: int = 1
+    approximate: bool = False
+class TransactionHistoryFiltersSchema(BaseModel):
     dt_start: date | None = None
     dt_end: date | None = None
     status: TransactionStatus | None = None
 
+class TransactonHistoryParamsSchema(TransactionHistoryFiltersSchema):
+    page: int = 1
+    cursor: str | None = None
+
+class TransactionPagesCountParamsSchema(TransactionHistoryFiltersSchema):
+    approximate: bool = False
+
+class TransactionHistoryExportParamsSchema(TransactionHistoryFiltersSchema):
+    format: Literal['ndjson', 'csv'] = 'ndjson'
+
 class TransactionHistoryResponceSchema(BaseModel):
     date: datetime
     direction: Literal['income', 'outcome']
@@ -1,3 +1,5 @@
+import os
+import uuid
 from typing import Literal
 
 from pydantic import Field
@@ -11,12 +13,39 @@ class Settings(BaseSettings):
     DB_NAME: str
     DB_USER: str
     DB_PASSWORD: str
+    DB_ECHO: bool = False
+    # the worker alone holds up to WORKER_CONCURRENCY + 1 connections, requests need the rest
+    DB_POOL_SIZE: int = Field(ge=1, default=10)
+    DB_MAX_OVERFLOW: int = Field(ge=0, default=10)
+    DB_POOL_TIMEOUT: float = Field(gt=0, default=30.0)  # seconds to wait for a free connection
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = Field(ge=-1, default=1800)  # seconds, -1 never recycles
+    DB_STATEMENT_CACHE_SIZE: int = Field(ge=0, default=100)  # prepared statements per connection
+    # pgbouncer in transaction mode: a connection may change between statements, so no prepared statement cache
+    DB_PGBOUNCER: bool = False
 
     SECRET_KEY: str
     ALGORITHM: Literal['HS256'] = Field(default='HS256')
     ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(ge=0, default=60 * 24)  # one day
+    TOKEN_CACHE_SIZE: int = Field(ge=0, default=10_000)  # verified tokens, each kept until its exp
+    PRINCIPAL_CACHE_SIZE: int = Field(ge=0, default=10_000)
+    # seconds; a password change made by another process is seen here only after this delay
+    PRINCIPAL_CACHE_TTL: float = Field(ge=0, default=2.0)
 
     RECORDS_IN_PAGE: int = 20
+    BATCH_MAX_ITEMS: int = Field(ge=1, default=1000)  # transfers in one /transaction/batch request
+    EXPORT_CHUNK_SIZE: int = Field(ge=1, default=1000)  # rows fetched from the server-side cursor at once
+
+    WORKER_ENABLED: bool = True
+    WORKER_CONCURRENCY: int = Field(ge=1, default=4)  # transactions settled at once
+    WORKER_BATCH_SIZE: int = Field(ge=1, default=20)  # transactions claimed at once
+    WORKER_POLL_INTERVAL: float = Field(gt=0, default=1.0)  # seconds
+    WORKER_LEASE_SECONDS: int = Field(gt=0, default=60)  # claimed but unsettled transactions are reclaimed after
+    WORKER_DRAIN_TIMEOUT: float = Field(ge=0, default=10.0)  # seconds to finish claimed transactions on shutdown
+
+    HASHER_EXECUTOR: Literal['thread', 'process'] = 'thread'
+    HASHER_WORKERS: int = Field(ge=1, default_factory=lambda: os.cpu_count() or 1)
+    HASHER_MAX_PENDING: int = Field(ge=1, default=64)  # hash/verify calls waiting or running
 
     @property
     def db_url(self) -> URL:
@@ -29,4 +58,24 @@ class Settings(BaseSettings):
             database=self.DB_NAME
         )
 
+    @property
+    def engine_options(self) -> dict:
+        statement_cache_size = 0 if self.DB_PGBOUNCER else self.DB_STATEMENT_CACHE_SIZE
+        connect_args = dict(
+            statement_cache_size=statement_cache_size,
+            prepared_statement_cache_size=statement_cache_size,
+        )
+        if self.DB_PGBOUNCER:
+            # unnamed statements may still collide between server connections
+            connect_args['prepared_statement_name_func'] = lambda: f'__asyncpg_{uuid.uuid4()}__'
+        return dict(
+            echo=self.DB_ECHO,
+            pool_size=self.DB_POOL_SIZE,
+            max_overflow=self.DB_MAX_OVERFLOW,
+            pool_timeout=self.DB_POOL_TIMEOUT,
+            pool_pre_ping=self.DB_POOL_PRE_PING,
+            pool_recycle=self.DB_POOL_RECYCLE,
+            connect_args=connect_args,
+        )
+
 settings = Settings()
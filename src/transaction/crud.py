@@ -1,18 +1,20 @@
+import json
 import math
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, date, time
 from decimal import Decimal
-from typing import Sequence
+from typing import Sequence, AsyncIterator
 
 from asyncpg.transaction import TransactionState
-from sqlalchemy import select, union_all, literal, Row, desc, insert, update, func, or_
+from sqlalchemy import select, union_all, literal, Row, desc, insert, update, func, or_, tuple_, Select, case, exists, and_, text
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import aliased
 
-from src.database.models import Transaction, TransactionStatus, User
-from src.schemas import TransactionResponceSchema
+from src.database.models import Transaction, TransactionStatus, User, UserTransactionCounter
+from src.metrics import TRANSACTION_STATUS_DWELL
+from src.schemas import TransactionResponceSchema, TransactionCreateSchema
 from src.settings import settings
 from src.transaction import logger
+from src.transaction.utils import HistoryCursor
 
 
 async def create_transaction(
@@ -35,97 +37,318 @@ async def create_transaction(
     await session.commit()
     return ret
 
-async def imitate_process_transaction(session: AsyncSession, t_id: int):
-    await session.execute(
+async def create_transactions(
+        session: AsyncSession,
+        from_user_id: uuid.UUID,
+        items: Sequence[TransactionCreateSchema]
+) -> list[TransactionResponceSchema]:
+    """Создаёт транзакции одним многострочным INSERT, результаты в порядке items"""
+    stmt = (
+        insert(Transaction)
+        .returning(Transaction.id, Transaction.dt, Transaction.status, sort_by_parameter_order=True)
+    )
+    rows = (await session.execute(
+        stmt,
+        [dict(from_user_id=from_user_id, to_user_id=item.to_user_id, amount=item.amount) for item in items]
+    )).all()
+    ret = [TransactionResponceSchema.model_construct(id=row[0], dt=row[1], status=row[2]) for row in rows]
+    await session.commit()
+    return ret
+
+
+async def claim_transactions(session: AsyncSession, limit: int, lease: timedelta) -> Sequence[int]:
+    """Захватывает до limit непроведённых транзакций для обработки.
+
+    Берутся транзакции CREATED и PROCESSED, захваченные раньше, чем lease назад
+    (обработчик упал или завис) или без времени захвата. Строки, заблокированные другими обработчиками,
+    пропускаются, поэтому несколько реплик сервиса не получают одни и те же транзакции.
+    """
+    pending = (
+        select(Transaction.id)
+        .where(
+            or_(
+                Transaction.status == TransactionStatus.CREATED,
+                and_(
+                    Transaction.status == TransactionStatus.PROCESSED,
+                    # rows left PROCESSED by the old in-request processing have no claim time
+                    or_(Transaction.claimed_at.is_(None), Transaction.claimed_at < func.now() - lease)
+                )
+            )
+        )
+        .order_by(Transaction.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
         update(Transaction)
-        .values(status=TransactionStatus.PROCESSED)
-        .where(Transaction.id == t_id)
+        .values(status=TransactionStatus.PROCESSED, claimed_at=func.now())
+        .where(Transaction.id.in_(pending.scalar_subquery()))
+        .returning(Transaction.id)
+        .execution_options(synchronize_session=False)
     )
+    t_ids = (await session.scalars(stmt)).all()
     await session.commit()
-    logger.info('Status transaction %d - %s', t_id, TransactionStatus.PROCESSED)
-    User1 = aliased(User)
-    params = (
-        await session.execute(
-            select(User.id, User.balance, Transaction.amount, User1.id, User1.balance)
-            .join_from(Transaction, User, onclause=User.id==Transaction.from_user_id)
-            .join(User1, onclause=Transaction.to_user_id==User1.id)
-            .where(Transaction.id == t_id)
+    if t_ids:
+        logger.info('Claimed %d transactions', len(t_ids))
+    return t_ids
+
+
+async def imitate_process_transaction(session: AsyncSession, t_id: int) -> TransactionStatus | None:
+    """Проводит транзакцию одним запросом.
+
+    Блокирует транзакцию и обоих пользователей (в порядке id, чтобы встречные
+    переводы не приводили к deadlock), списывает сумму, если на балансе её хватает,
+    зачисляет получателю и ставит статус DONE, иначе CANCELED.
+    Возвращает новый статус или None, если транзакция уже проведена.
+    """
+    t = (
+        select(Transaction.id, Transaction.from_user_id, Transaction.to_user_id, Transaction.amount)
+        .where(
+            Transaction.id == t_id,
+            Transaction.status.in_((TransactionStatus.CREATED, TransactionStatus.PROCESSED))
         )
-    ).first()
-    if None in params or params[1] < params[2]:
-        await session.execute(
-            update(Transaction)
-            .values(status=TransactionStatus.CANCELED)
-            .where(Transaction.id == t_id)
+        .with_for_update()
+        .cte('t')
+    )
+    self_transfer = t.c.from_user_id == t.c.to_user_id
+    locked = (
+        select(func.count().label('users'))
+        .select_from(
+            select(User.id)
+            .join(t, or_(User.id == t.c.from_user_id, User.id == t.c.to_user_id))
+            .order_by(User.id)
+            .with_for_update(of=User)
+            .subquery()
         )
-        logger.error('Transaction %d was canceled', t_id)
-    else:
-        await session.execute(
-            update(User)
-            .values(balance=params[1] - params[2])
-            .where(User.id == params[0])
+        .cte('locked')
+    )
+    debit = (
+        update(User)
+        .values(balance=User.balance - case((self_transfer, 0), else_=t.c.amount))
+        .where(
+            User.id == t.c.from_user_id,
+            User.balance >= t.c.amount,
+            locked.c.users == case((self_transfer, 1), else_=2)  # both users exist
         )
-        await session.execute(
-            update(User)
-            .values(balance=params[2] + params[4])
-            .where(User.id == params[3])
+        .returning(User.id)
+        .cte('debit')
+    )
+    credit = (
+        update(User)
+        .values(balance=User.balance + t.c.amount)
+        .where(User.id == t.c.to_user_id, ~self_transfer, exists(debit.select()))
+        .returning(User.id)
+        .cte('credit')
+    )
+    status_type = Transaction.status.type
+    stmt = (
+        update(Transaction)
+        .values(
+            status=case(
+                (exists(debit.select()), literal(TransactionStatus.DONE, status_type)),
+                else_=literal(TransactionStatus.CANCELED, status_type)
+            )
         )
-        await session.execute(
-            update(Transaction)
-            .values(status=TransactionStatus.DONE)
-            .where(Transaction.id == t_id)
+        .where(Transaction.id == t.c.id)
+        .add_cte(credit)
+        .returning(
+            Transaction.status,
+            func.extract('epoch', func.coalesce(Transaction.claimed_at, func.localtimestamp()) - Transaction.dt),
+            func.extract('epoch', func.localtimestamp() - Transaction.claimed_at),
         )
-        logger.info('Successfully processed transaction %d', t_id)
+        .execution_options(synchronize_session=False)
+    )
+    row = (await session.execute(stmt)).first()
     await session.commit()
+    new_status = None
+    if row is not None:
+        new_status, created_dwell, processed_dwell = row
+        TRANSACTION_STATUS_DWELL.labels(TransactionStatus.CREATED.name).observe(max(created_dwell, 0))
+        if processed_dwell is not None:
+            TRANSACTION_STATUS_DWELL.labels(TransactionStatus.PROCESSED.name).observe(max(processed_dwell, 0))
+    if new_status == TransactionStatus.DONE:
+        logger.info('Successfully processed transaction %d', t_id)
+    elif new_status == TransactionStatus.CANCELED:
+        logger.error('Transaction %d was canceled', t_id)
+    else:
+        logger.warning('Transaction %d is already processed', t_id)
+    return new_status
 
 
-async def get_user_transactions_pagecount(
+def _dt_conditions(dt_start: datetime | date | None, dt_end: datetime | date | None) -> list:
+    """Границы периода включительно; для дат берутся сутки целиком"""
+    conditions = []
+    if dt_start is not None:
+        if not isinstance(dt_start, datetime):
+            dt_start = datetime.combine(dt_start, time.min)
+        conditions.append(Transaction.dt >= dt_start)
+    if dt_end is not None:
+        if isinstance(dt_end, datetime):
+            conditions.append(Transaction.dt <= dt_end)
+        else:  # the whole last day is included
+            conditions.append(Transaction.dt < datetime.combine(dt_end + timedelta(days=1), time.min))
+    return conditions
+
+
+def build_count_query(
+        user_id: uuid.UUID,
+        *,
+        dt_start: datetime | date | None = None,
+        dt_end: datetime | date | None = None,
+        status: TransactionState | None = None,
+) -> Select:
+    """Количество строк истории пользователя с фильтрами.
+
+    Исходящие и входящие считаются отдельно, каждые по своему индексу истории.
+    """
+    conditions = _dt_conditions(dt_start, dt_end)
+    if status is not None:
+        conditions.append(Transaction.status == status)
+    outgoing, incoming = (
+        select(func.count()).where(c == user_id, *conditions).scalar_subquery()
+        for c in (Transaction.from_user_id, Transaction.to_user_id)
+    )
+    return select(outgoing + incoming)
+
+
+async def count_user_transactions(
         session: AsyncSession,
-        user_id: uuid.UUID
+        user_id: uuid.UUID,
+        *,
+        dt_start: datetime | date | None = None,
+        dt_end: datetime | date | None = None,
+        status: TransactionState | None = None,
+        approximate: bool = False,
 ) -> int:
-    stmt = (
-        select(func.count(Transaction.id))
-        .where(
-            or_(
-                Transaction.from_user_id==user_id,
-                Transaction.to_user_id==user_id
-            )
+    """Количество строк истории пользователя.
+
+    Без фильтра по датам берётся из счётчиков (user_transaction_counters), иначе считается
+    по индексам или, если approximate, оценивается планировщиком без чтения строк.
+    """
+    if dt_start is None and dt_end is None:
+        column = (
+            UserTransactionCounter.outgoing + UserTransactionCounter.incoming if status is None
+            else getattr(UserTransactionCounter, status.name.lower())
         )
-    )
-    total = await session.scalar(stmt)
-    return math.ceil(total / settings.RECORDS_IN_PAGE)
+        return await session.scalar(select(column).where(UserTransactionCounter.user_id == user_id)) or 0
+    if approximate:
+        stmt = build_history_query(user_id, dt_start=dt_start, dt_end=dt_end, status=status)
+        query = stmt.compile(dialect=session.bind.dialect, compile_kwargs={'literal_binds': True})
+        plan = await session.scalar(text(f'EXPLAIN (FORMAT JSON) {query}'))
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+    return await session.scalar(build_count_query(user_id, dt_start=dt_start, dt_end=dt_end, status=status))
 
 
-async def get_transactions(
+async def get_user_transactions_pagecount(
         session: AsyncSession,
+        user_id: uuid.UUID,
+        **filters
+) -> int:
+    """Число страниц истории; без фильтров - один поиск по первичному ключу счётчиков"""
+    total = await count_user_transactions(session, user_id, **filters)
+    return math.ceil(total / settings.RECORDS_IN_PAGE)
+
+
+def build_history_query(
         user_id: uuid.UUID,
         *,
         page: int | None = None,
-        dt_start: datetime | None = None,
-        dt_end:datetime | None = None,
+        cursor: HistoryCursor | None = None,
+        dt_start: datetime | date | None = None,
+        dt_end: datetime | date | None = None,
         status: TransactionState | None = None,
-) -> Sequence[Row]:
+        lookahead: bool = False,
+) -> Select:
+    """Запрос движений по балансу пользователя от новых к старым.
+
+    Если передан cursor, выбирается страница строк, идущих после него
+    (keyset-пагинация, page игнорируется), иначе - страница page через OFFSET.
+    С lookahead к странице добавляется первая строка следующей.
+    """
+    limit = None
+    page_size = settings.RECORDS_IN_PAGE + lookahead
+    if cursor is not None:
+        limit = page_size
+    elif page is not None and page > 0:
+        limit = (page - 1) * settings.RECORDS_IN_PAGE + page_size
+    dt_conditions = _dt_conditions(dt_start, dt_end)
     stmts = []
     for i, c in enumerate((Transaction.from_user_id, Transaction.to_user_id)):
+        direction = 'outcome' if i == 0 else 'income'
         stmt = select(
             Transaction.dt.label('date'),
-            literal('outcome' if i == 0 else 'income').label('direction'),
+            literal(direction).label('direction'),
             (Transaction.amount * (2 * i - 1)).label('amount'), # sign -1 or 1
-            Transaction.status.label('status')
+            Transaction.status.label('status'),
+            Transaction.id.label('id'),
         ).where(c == user_id)
-        if isinstance(dt_start, datetime):
-            stmt = stmt.where(Transaction.dt >= dt_start)
-        if isinstance(dt_end, datetime):
-            stmt = stmt.where(Transaction.dt <= dt_end)
+        stmt = stmt.where(*dt_conditions)
         if status is not None:
             stmt = stmt.where(Transaction.status == status)
+        if cursor is not None:
+            # rows with the same (dt, id) are ordered by direction: income, outcome
+            key, cursor_key = tuple_(Transaction.dt, Transaction.id), tuple_(cursor.dt, cursor.id)
+            stmt = stmt.where(key <= cursor_key if direction > cursor.direction else key < cursor_key)
+        if limit is not None:
+            # each branch is read from its own (user_id, dt DESC, id DESC) index and stops early
+            stmt = stmt.order_by(Transaction.dt.desc(), Transaction.id.desc()).limit(limit)
         stmts.append(stmt)
-    stmt = select(union_all(*stmts).subquery()).order_by(desc('date'))
-    if page is not None and page > 0:
-        stmt = (
-            stmt
-            .offset((page - 1) * settings.RECORDS_IN_PAGE)
-            .limit(settings.RECORDS_IN_PAGE)
-        )
+    stmt = select(union_all(*stmts).subquery()).order_by(desc('date'), desc('id'), 'direction')
+    if limit is not None:
+        stmt = stmt.offset(limit - page_size).limit(page_size)
+    return stmt
+
+
+async def get_transactions(
+        session: AsyncSession,
+        user_id: uuid.UUID,
+        *,
+        page: int | None = None,
+        cursor: HistoryCursor | None = None,
+        dt_start: datetime | date | None = None,
+        dt_end: datetime | date | None = None,
+        status: TransactionState | None = None,
+) -> Sequence[Row]:
+    stmt = build_history_query(
+        user_id, page=page, cursor=cursor, dt_start=dt_start, dt_end=dt_end, status=status
+    )
     result = (await session.execute(stmt)).all()
     return result
+
+
+async def get_transactions_page(
+        session: AsyncSession,
+        user_id: uuid.UUID,
+        *,
+        page: int | None = None,
+        cursor: HistoryCursor | None = None,
+        dt_start: datetime | date | None = None,
+        dt_end: datetime | date | None = None,
+        status: TransactionState | None = None,
+) -> tuple[Sequence[Row], bool]:
+    """Страница истории и признак наличия следующей (по лишней строке, без подсчёта)"""
+    stmt = build_history_query(
+        user_id, page=page, cursor=cursor, dt_start=dt_start, dt_end=dt_end, status=status, lookahead=True
+    )
+    result = (await session.execute(stmt)).all()
+    return result[:settings.RECORDS_IN_PAGE], len(result) > settings.RECORDS_IN_PAGE
+
+
+async def stream_transactions(
+        session: AsyncSession,
+        user_id: uuid.UUID,
+        *,
+        dt_start: datetime | date | None = None,
+        dt_end: datetime | date | None = None,
+        status: TransactionState | None = None,
+) -> AsyncIterator[Sequence[Row]]:
+    """Вся история пользователя пачками по EXPORT_CHUNK_SIZE строк через серверный курсор"""
+    stmt = (
+        build_history_query(user_id, dt_start=dt_start, dt_end=dt_end, status=status)
+        .execution_options(yield_per=settings.EXPORT_CHUNK_SIZE)
+    )
+    result = await session.stream(stmt)
+    async for rows in result.partitions():
+        yield rows
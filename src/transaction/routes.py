@@ -1,17 +1,21 @@
-from typing import Annotated
+import uuid
+from typing import Annotated, AsyncIterator
 
-from fastapi import APIRouter, Depends, Body, HTTPException, BackgroundTasks, Query
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, Body, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from starlette import status
+from starlette.responses import Response, StreamingResponse
 
-from src.crud import get_user
-from src.database.connection import get_async_session
-from src.database.models import User
+from src.crud import get_balances
+from src.database.connection import get_async_session, get_session_maker
 from src.schemas import TransactionCreateSchema, TransactionResponceSchema, TransactionPagesCountSchema, \
-    TransactonHistoryParamsSchema, TransactionHistoryResponceSchema
+    TransactonHistoryParamsSchema, TransactionHistoryResponceSchema, TransactionHistoryExportParamsSchema, \
+    TransactionBatchResultSchema, PrincipalSchema, TransactionPagesCountParamsSchema
+from src.settings import settings
 from src.transaction import crud, logger
-from src.transaction.crud import imitate_process_transaction
 from src.transaction.dependencies import get_current_user
+from src.transaction.utils import HistoryCursor, history_to_csv, history_to_ndjson
+from src.transaction.worker import settlement_worker
 
 router = APIRouter(prefix='/transaction', tags=['Сервис транзакций'])
 
@@ -23,35 +27,91 @@ router = APIRouter(prefix='/transaction', tags=['Сервис транзакци
 )
 async def create_transaction(
         session: Annotated[AsyncSession, Depends(get_async_session)],
-        user: Annotated[User, Depends(get_current_user)],
+        user: Annotated[PrincipalSchema, Depends(get_current_user)],
         params: Annotated[TransactionCreateSchema, Body()],
-        background_tasks: BackgroundTasks
 ):
     """Ручка для перевода денег.
 
     Параметры:
     - :body **to_user_id** - id пользователя, которому нужно перевести
     - :body **amount** - сумма
+
+    Транзакция проводится в фоне (статус CREATED -> PROCESSED -> DONE или CANCELED).
     """
-    second_user = await get_user(session, params.to_user_id)
-    if user.balance < params.amount or second_user is None:
+    balances = await get_balances(session, (user.id, params.to_user_id))
+    if params.to_user_id not in balances or balances.get(user.id, 0) < params.amount:
         raise HTTPException(status.HTTP_403_FORBIDDEN, 'Bad request parameters')
     result = await crud.create_transaction(session, user.id, **params.model_dump())
     logger.info('Transaction %d was created', result.id)
-    background_tasks.add_task(imitate_process_transaction, session, result.id)
+    settlement_worker.notify()
     return result
 
+@router.post(
+    '/batch',
+    response_model=list[TransactionBatchResultSchema],
+    status_code=status.HTTP_201_CREATED,
+    summary='Создать несколько транзакций'
+)
+async def create_transactions_batch(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        user: Annotated[PrincipalSchema, Depends(get_current_user)],
+        items: Annotated[
+            list[TransactionCreateSchema],
+            Body(min_length=1, max_length=settings.BATCH_MAX_ITEMS)
+        ],
+):
+    """Ручка для пакетного перевода денег (например, выплаты зарплаты).
+
+    Тело запроса - список переводов, как у /transaction/create.
+    Переводы проверяются по порядку: получатель должен существовать, а сумма
+    принятых переводов не должна превышать баланс. Возвращается результат по
+    каждому переводу в том же порядке: созданная транзакция или ошибка.
+    """
+    balances = await get_balances(session, (user.id, *(item.to_user_id for item in items)))
+    results = [TransactionBatchResultSchema() for _ in items]
+    accepted, accepted_idx = [], []
+    balance = balances.get(user.id, 0)
+    for i, item in enumerate(items):
+        if item.to_user_id not in balances:
+            results[i].error = 'Recipient not found'
+        elif balance < item.amount:
+            results[i].error = 'Insufficient funds'
+        else:
+            balance -= item.amount
+            accepted.append(item)
+            accepted_idx.append(i)
+    if accepted:
+        created = await crud.create_transactions(session, user.id, accepted)
+        for i, transaction in zip(accepted_idx, created):
+            results[i].transaction = transaction
+        settlement_worker.notify()
+    logger.info('Batch of %d transactions, %d created', len(items), len(accepted))
+    return results
+
 @router.get(
     '/pagescount',
     response_model=TransactionPagesCountSchema,
-    summary='Получение количества страниц записей о транзакциях (без фильтров)'
+    summary='Получение количества страниц записей о транзакциях'
 )
 async def get_user_transactions_pagecount(
         session: Annotated[AsyncSession, Depends(get_async_session)],
-        user: Annotated[User, Depends(get_current_user)],
+        user: Annotated[PrincipalSchema, Depends(get_current_user)],
+        params: Annotated[TransactionPagesCountParamsSchema, Query()],
 ):
-    result = await crud.get_user_transactions_pagecount(session, user.id)
-    return TransactionPagesCountSchema(pages_count=result)
+    """Ручка для получения количества страниц истории с теми же фильтрами, что у /transaction/history.
+
+    Фильтры:
+    - :body **dt_start** - дата начала (включительно)
+    - :body **dt_end** - дата окончания (включительно)
+    - :body **status** - статус транзации
+
+    Параметры:
+    - :body **approximate** - оценить количество по статистике планировщика
+    (быстро для больших выборок, используется только с фильтром по датам)
+    """
+    approximate = params.approximate and (params.dt_start is not None or params.dt_end is not None)
+    result = await crud.get_user_transactions_pagecount(session, user.id, **params.model_dump())
+    return TransactionPagesCountSchema(pages_count=result, approximate=approximate)
 
 @router.get(
     '/history',
@@ -60,18 +120,72 @@ async def get_user_transactions_pagecount(
 )
 async def get_user_transaction_history(
         session: Annotated[AsyncSession, Depends(get_async_session)],
-        user: Annotated[User, Depends(get_current_user)],
-        params: Annotated[TransactonHistoryParamsSchema, Query()]
+        user: Annotated[PrincipalSchema, Depends(get_current_user)],
+        params: Annotated[TransactonHistoryParamsSchema, Query()],
+        response: Response
 ):
     """Ручка для получния записей о транзакциях по балансу пользователя.
 
     Параметры:
     - :body **page** - номер страницы (пагинация)
+    - :body **cursor** - курсор из заголовка X-Next-Cursor предыдущего ответа
+    (пагинация без OFFSET, page игнорируется)
     Фильтры:
-    - :body **dt_start** - дата начала
+    - :body **dt_start** - дата начала (включительно)
     - :body **dt_end** - дата окончания (включительно)
     - :body **status** - статус транзации
+
+    Заголовок X-Has-Next (true/false) сообщает, есть ли следующая страница,
+    если есть - в заголовке X-Next-Cursor возвращается её курсор.
     """
-    result = await crud.get_transactions(session, user.id, **params.model_dump())
+    cursor = None
+    if params.cursor:
+        try:
+            cursor = HistoryCursor.decode(params.cursor)
+        except ValueError:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Bad cursor')
+    result, has_next = await crud.get_transactions_page(
+        session, user.id, **params.model_dump(exclude={'cursor'}), cursor=cursor
+    )
+    response.headers['X-Has-Next'] = 'true' if has_next else 'false'
+    if has_next:
+        response.headers['X-Next-Cursor'] = HistoryCursor.from_row(result[-1]).encode()
     logger.info('User %s has %d transactions on page %d', user.id, len(result), params.page)
     return result
+
+async def _export_history(
+        session_maker: async_sessionmaker[AsyncSession],
+        user_id: uuid.UUID,
+        params: TransactionHistoryExportParamsSchema
+) -> AsyncIterator[str]:
+    # the body is sent after request dependencies are closed, so the export opens its own session
+    async with session_maker() as session:
+        if params.format == 'csv':
+            yield history_to_csv((), header=True)
+        count = 0
+        async for rows in crud.stream_transactions(session, user_id, **params.model_dump(exclude={'format'})):
+            count += len(rows)
+            yield history_to_csv(rows) if params.format == 'csv' else history_to_ndjson(rows)
+        logger.info('User %s exported %d transactions', user_id, count)
+
+@router.get(
+    '/history/export',
+    response_class=StreamingResponse,
+    summary='Выгрузка всей истории движения средств на балансе пользователя'
+)
+async def export_user_transaction_history(
+        session_maker: Annotated[async_sessionmaker[AsyncSession], Depends(get_session_maker)],
+        user: Annotated[PrincipalSchema, Depends(get_current_user)],
+        params: Annotated[TransactionHistoryExportParamsSchema, Query()]
+):
+    """Ручка для выгрузки всех записей о транзакциях по балансу пользователя построчно.
+
+    Параметры:
+    - :body **format** - формат выгрузки: ndjson (по умолчанию) или csv
+    Фильтры:
+    - :body **dt_start** - дата начала (включительно)
+    - :body **dt_end** - дата окончания (включительно)
+    - :body **status** - статус транзации
+    """
+    media_type = 'text/csv' if params.format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(_export_history(session_maker, user.id, params), media_type=media_type)
@@ -0,0 +1,56 @@
+import base64
+import csv
+import io
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Literal, Sequence
+
+from sqlalchemy import Row
+
+from src.schemas import TransactionHistoryResponceSchema
+
+
+@dataclass(frozen=True)
+class HistoryCursor:
+    """Позиция в истории транзакций: последняя выданная строка (дата, id, направление)"""
+    dt: datetime
+    id: int
+    direction: Literal['income', 'outcome']
+
+    @classmethod
+    def from_row(cls, row: Row) -> 'HistoryCursor':
+        return cls(dt=row.date, id=row.id, direction=row.direction)
+
+    def encode(self) -> str:
+        raw = json.dumps([self.dt.isoformat(), self.id, self.direction], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).rstrip(b'=').decode()
+
+    @classmethod
+    def decode(cls, value: str) -> 'HistoryCursor':
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            dt, id_, direction = json.loads(raw)
+            if direction not in ('income', 'outcome') or not isinstance(id_, int):
+                raise ValueError
+            return cls(dt=datetime.fromisoformat(dt), id=id_, direction=direction)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f'Bad cursor {value!r}') from e
+
+
+def history_to_ndjson(rows: Sequence[Row]) -> str:
+    return ''.join(
+        TransactionHistoryResponceSchema.model_validate(row, from_attributes=True).model_dump_json() + '\n'
+        for row in rows
+    )
+
+
+def history_to_csv(rows: Sequence[Row], header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow(TransactionHistoryResponceSchema.model_fields)
+    for row in rows:
+        item = TransactionHistoryResponceSchema.model_validate(row, from_attributes=True)
+        writer.writerow(item.model_dump(mode='json').values())
+    return buffer.getvalue()
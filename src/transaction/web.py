@@ -1,13 +1,29 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from src.logconf import LoggerMiddleware
+from src.metrics import MetricsMiddleware
+from src.routes import service_router
+from src.settings import settings
 from src.transaction.routes import router
+from src.transaction.worker import settlement_worker
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.WORKER_ENABLED:
+        await settlement_worker.start()
+    yield
+    await settlement_worker.stop(settings.WORKER_DRAIN_TIMEOUT)
 
 
 def create_app() -> FastAPI:
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     app.include_router(router)
+    app.include_router(service_router)
+    app.add_middleware(MetricsMiddleware)
     app.add_middleware(LoggerMiddleware)
     return app
 
-app = create_app()
\ No newline at end of file
+app = create_app()
@@ -0,0 +1,135 @@
+import asyncio
+from contextlib import suppress
+from datetime import timedelta
+
+from prometheus_client import REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from src.database.connection import SessionMaker
+from src.settings import settings
+from src.transaction import logger
+from src.transaction.crud import claim_transactions, imitate_process_transaction
+
+
+class SettlementWorker:
+    """Фоновое проведение транзакций в статусе CREATED.
+
+    Один цикл захватывает транзакции пачками (см. claim_transactions) в очередь,
+    concurrency обработчиков проводят их, каждую в своей сессии.
+    Захваченная транзакция помечается PROCESSED, поэтому при падении процесса
+    она не теряется, а перезахватывается после истечения lease.
+    """
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker[AsyncSession],
+            *,
+            concurrency: int,
+            batch_size: int,
+            poll_interval: float,
+            lease: timedelta
+    ):
+        self.session_maker = session_maker
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.settled = 0
+        self._wakeup: asyncio.Event | None = None
+        self._queue: asyncio.Queue[int] | None = None
+        self._claimer: asyncio.Task | None = None
+        self._settlers: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return self._claimer is not None
+
+    def notify(self):
+        """Разбудить обработчик, не дожидаясь poll_interval (например, после создания транзакции)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._queue = asyncio.Queue(maxsize=self.batch_size)
+        self._claimer = asyncio.create_task(self._claim_loop(), name='settlement-claimer')
+        self._settlers = [
+            asyncio.create_task(self._settle_loop(), name=f'settlement-{i}')
+            for i in range(self.concurrency)
+        ]
+        logger.info('Settlement worker started with %d settlers', self.concurrency)
+
+    async def stop(self, timeout: float):
+        """Перестаёт захватывать транзакции и ждёт до timeout секунд проведения уже захваченных"""
+        if not self.running:
+            return
+        self._claimer.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._claimer
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except TimeoutError:
+            logger.warning('%d claimed transactions left unprocessed', self._queue.qsize())
+        for task in self._settlers:
+            task.cancel()
+        await asyncio.gather(*self._settlers, return_exceptions=True)
+        self._claimer, self._settlers = None, []
+        logger.info('Settlement worker stopped')
+
+    async def _claim_loop(self):
+        while True:
+            self._wakeup.clear()
+            free = self._queue.maxsize - self._queue.qsize()
+            t_ids = []
+            if free:
+                try:
+                    async with self.session_maker() as session:
+                        t_ids = await claim_transactions(session, free, self.lease)
+                except Exception:
+                    logger.exception('Cannot claim transactions')
+            for t_id in t_ids:
+                self._queue.put_nowait(t_id)
+            if not free or len(t_ids) < free:
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+
+    async def _settle_loop(self):
+        while True:
+            t_id = await self._queue.get()
+            try:
+                async with self.session_maker() as session:
+                    if await imitate_process_transaction(session, t_id) is not None:
+                        self.settled += 1
+            except Exception:
+                # stays PROCESSED and will be claimed again after the lease
+                logger.exception('Cannot process transaction %d', t_id)
+            finally:
+                self._queue.task_done()
+                if self._queue.empty():
+                    self._wakeup.set()
+
+
+class WorkerCollector(Collector):
+    def collect(self):
+        yield CounterMetricFamily(
+            'settlement_transactions_settled', 'Проведено транзакций этим процессом', value=settlement_worker.settled
+        )
+        queue = settlement_worker._queue
+        yield GaugeMetricFamily(
+            'settlement_queue_size', 'Захвачено и ждёт проведения', value=queue.qsize() if queue is not None else 0
+        )
+
+
+settlement_worker = SettlementWorker(
+    SessionMaker,
+    concurrency=settings.WORKER_CONCURRENCY,
+    batch_size=settings.WORKER_BATCH_SIZE,
+    poll_interval=settings.WORKER_POLL_INTERVAL,
+    lease=timedelta(seconds=settings.WORKER_LEASE_SECONDS)
+)
+
+REGISTRY.register(WorkerCollector())
@@ -1,14 +1,21 @@
+import hashlib
+import time
 import uuid
+from collections import OrderedDict
 from datetime import timedelta, datetime, timezone
-from typing import Annotated
+from typing import Annotated, Generic, Hashable, TypeVar
 
 import jwt
 from fastapi import HTTPException
 from jwt import InvalidTokenError
 from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
+from starlette.requests import Request
 
-from src.schemas import JWTPayloadSchema
+from src.crud import get_principal, get_user
+from src.database.models import User
+from src.schemas import JWTPayloadSchema, PrincipalSchema
 from src.settings import settings
 
 credentials_exception = HTTPException(
@@ -17,8 +24,56 @@ credentials_exception = HTTPException(
     headers={"WWW-Authenticate": "Bearer"},
 )
 
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    """LRU-кэш на maxsize записей, каждая запись живёт до своего expires_at (unix time)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: K) -> V | None:
+        item = self._data.get(key)
+        if item is not None:
+            if item[0] > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            del self._data[key]
+        self.misses += 1
+
+    def set(self, key: K, value: V, expires_at: float):
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+claims_cache: TTLCache[bytes, JWTPayloadSchema] = TTLCache(settings.TOKEN_CACHE_SIZE)
+principal_cache: TTLCache[uuid.UUID, PrincipalSchema] = TTLCache(settings.PRINCIPAL_CACHE_SIZE)
+
 
 async def decode_payload(token: str) -> JWTPayloadSchema | None:
+    key = hashlib.sha256(token.encode()).digest()
+    payload_schema = claims_cache.get(key)
+    if payload_schema is not None:
+        return payload_schema
     options = {
         "verify_signature": True,
         "verify_exp": True,
@@ -31,6 +86,68 @@ async def decode_payload(token: str) -> JWTPayloadSchema | None:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM], options=options)
         payload_schema = JWTPayloadSchema.model_validate(payload)
+        claims_cache.set(key, payload_schema, payload['exp'])
         return payload_schema
     except (InvalidTokenError, ValidationError):
         pass
+
+
+async def request_token_payload(request: Request, token: str) -> JWTPayloadSchema | None:
+    """Payload токена, уже проверенный LoggerMiddleware для этого запроса, иначе декодирует сам"""
+    decoded = getattr(request.state, 'token_payload', None)
+    if decoded is not None and decoded[0] == token:
+        return decoded[1]
+    return await decode_payload(token)
+
+
+def _check_password_time(password_set_time: datetime, payload_schema: JWTPayloadSchema):
+    if password_set_time.replace(tzinfo=timezone.utc) > payload_schema.created:
+        raise credentials_exception
+
+
+async def authenticate_token(
+        session: AsyncSession,
+        token: str,
+        payload_schema: JWTPayloadSchema | None = None
+) -> PrincipalSchema:
+    """Пользователь по токену. Токены, выданные до смены пароля, не принимаются.
+
+    Пользователь берётся из principal_cache, поэтому смена пароля в другом процессе
+    видна здесь не позже чем через PRINCIPAL_CACHE_TTL секунд.
+    """
+    if payload_schema is None:
+        payload_schema = await decode_payload(token)
+    if payload_schema is None:
+        raise credentials_exception
+    principal = principal_cache.get(payload_schema.sub)
+    if principal is None:
+        principal = await get_principal(session, payload_schema.sub)
+        if principal is None:
+            raise credentials_exception
+        principal_cache.set(principal.id, principal, time.time() + settings.PRINCIPAL_CACHE_TTL)
+    _check_password_time(principal.password_set_time, payload_schema)
+    return principal
+
+
+async def authenticate_token_user(
+        session: AsyncSession,
+        token: str,
+        payload_schema: JWTPayloadSchema | None = None
+) -> User:
+    """Полная запись пользователя по токену (одним запросом, без principal_cache)"""
+    if payload_schema is None:
+        payload_schema = await decode_payload(token)
+    if payload_schema is None:
+        raise credentials_exception
+    user = await get_user(session, payload_schema.sub)
+    if user is None:
+        raise credentials_exception
+    _check_password_time(user.password_set_time, payload_schema)
+    return user
+
+
+def auth_cache_stats() -> dict[str, dict[str, int]]:
+    return {
+        name: dict(size=len(cache), hits=cache.hits, misses=cache.misses)
+        for name, cache in (('claims', claims_cache), ('principal', principal_cache))
+    }
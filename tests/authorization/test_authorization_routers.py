@@ -65,3 +65,13 @@ async def test_change_user_password_return_401(client_u1: AsyncClient, users: li
     data = dict(old_password='wrong_password', new_password='111')
     responce = await client_u1.patch('/me/change_password', json=data)
     assert status.HTTP_401_UNAUTHORIZED == responce.status_code
+
+async def test_read_users_me_with_token_uses_claims_cache(client: AsyncClient, users: list[UserSchema]):
+    responce = await client.post('/token', data=FormData(dict(username=users[0].fullname, password='123')))
+    headers = {'Authorization': f'Bearer {responce.json()["access_token"]}'}
+    for _ in range(2):
+        responce = await client.get('/me', headers=headers)
+        assert status.HTTP_200_OK == responce.status_code
+        assert users[0].id == UserResponceSchema.model_validate(responce.json()).id
+    stats = (await client.get('/stats/auth-cache')).json()
+    assert stats['claims'] == dict(size=1, hits=1, misses=1)
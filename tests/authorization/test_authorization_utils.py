@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+from starlette import status
+
+from src.authorization.utils import PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    h = PasswordHasher('thread', 2, 2)
+    yield h
+    h.shutdown()
+
+async def test_password_hasher_hash_and_verify(hasher: PasswordHasher):
+    verify_count = REGISTRY.get_sample_value('password_hash_duration_seconds_count', {'operation': 'verify'}) or 0
+    hashed = await hasher.hash('123')
+    assert hashed != '123'
+    assert await hasher.verify('123', hashed)
+    assert not await hasher.verify('321', hashed)
+    stats = hasher.snapshot()
+    assert stats.calls == 3
+    assert stats.in_flight == 0
+    assert 0 < stats.avg_time <= stats.max_time
+    assert REGISTRY.get_sample_value(
+        'password_hash_duration_seconds_count', {'operation': 'verify'}
+    ) == verify_count + 2
+
+async def test_password_hasher_rejects_when_queue_is_full(hasher: PasswordHasher):
+    results = await asyncio.gather(*(hasher.hash('123') for _ in range(3)), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, HTTPException)]
+    assert len(errors) == 1
+    assert errors[0].status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert hasher.snapshot().rejected == 1
@@ -7,11 +7,14 @@ import pytest
 from sqlalchemy import NullPool, select
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
-import src
+import src.authorization.crud
+import src.authorization.dependencies
+import src.authorization.routes
 from src.authorization.utils import get_password_hash
 from src.database.models import User, Transaction, TransactionStatus
 from src.schemas import UserSchema, TransactionSchema
 from src.settings import settings
+from src.utils import claims_cache, principal_cache
 
 @pytest.fixture(scope='session', autouse=True)
 async def engine():
@@ -106,9 +109,19 @@ async def transactions(session: AsyncSession, users: list[UserSchema]) -> list[T
 
 @pytest.fixture(autouse=True)
 def get_password_hash_and_verify_fast(monkeypatch):
-    f = lambda x: x
-    g = lambda x, y: x == y
+    async def f(x):
+        return x
+
+    async def g(x, y):
+        return x == y
+
     monkeypatch.setattr(src.authorization.crud, 'get_password_hash', f)
     monkeypatch.setattr(src.authorization.dependencies, 'verify_password', g)
     monkeypatch.setattr(src.authorization.routes, 'verify_password', g)
-    yield
\ No newline at end of file
+    yield
+
+@pytest.fixture(autouse=True)
+def clear_auth_caches():
+    yield
+    claims_cache.clear()
+    principal_cache.clear()
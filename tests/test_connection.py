@@ -0,0 +1,27 @@
+from sqlalchemy import select, literal
+
+from src.database.connection import create_engine
+from src.settings import settings
+
+
+async def test_engine_from_settings():
+    engine = create_engine(settings.model_copy(update=dict(DB_POOL_SIZE=3, DB_MAX_OVERFLOW=1)))
+    try:
+        assert engine.pool.size() == 3
+        assert engine.pool._max_overflow == 1
+        assert engine.echo is False
+    finally:
+        await engine.dispose()
+
+async def test_pgbouncer_profile_disables_statement_cache():
+    pgbouncer_settings = settings.model_copy(update=dict(DB_PGBOUNCER=True))
+    options = pgbouncer_settings.engine_options
+    assert options['connect_args']['statement_cache_size'] == 0
+    assert options['connect_args']['prepared_statement_cache_size'] == 0
+    engine = create_engine(pgbouncer_settings)
+    try:
+        async with engine.connect() as conn:
+            for i in range(3):
+                assert await conn.scalar(select(literal(i))) == i
+    finally:
+        await engine.dispose()
@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import Request
+
+from src.authorization.dependencies import create_access_token
+from src.database.models import User
+from src.logconf import LoggerMiddleware, _extra
+from src.schemas import UserSchema
+from src.utils import TTLCache, authenticate_token, claims_cache, principal_cache, request_token_payload
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    cache = TTLCache(2)
+    now = time.time()
+    cache.set('a', 1, now + 60)
+    cache.set('b', 2, now + 60)
+    assert cache.get('a') == 1
+    cache.set('c', 3, now + 60)  # 'b' is the least recently used
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    cache.set('d', 4, now - 1)
+    assert cache.get('d') is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+async def test_authenticate_token_caches_claims_and_principal(session: AsyncSession, users: list[UserSchema]):
+    token = create_access_token({'sub': str(users[0].id), 'username': users[0].fullname})
+    principal = await authenticate_token(session, token)
+    assert principal.id == users[0].id
+    assert principal.fullname == users[0].fullname
+    assert (claims_cache.misses, principal_cache.misses) == (1, 1)
+    assert await authenticate_token(session, token) == principal
+    assert (claims_cache.hits, principal_cache.hits) == (1, 1)
+
+async def test_authenticate_token_rejects_token_issued_before_password_change(
+        session: AsyncSession, users: list[UserSchema]):
+    token = create_access_token({'sub': str(users[0].id), 'username': users[0].fullname})
+    await authenticate_token(session, token)
+    await session.execute(
+        update(User)
+        .values(password_set_time=User.password_set_time + timedelta(days=1))
+        .where(User.id == users[0].id)
+    )
+    principal_cache.pop(users[0].id)
+    with pytest.raises(HTTPException):
+        await authenticate_token(session, token)
+
+async def test_authenticate_token_rejects_expired_token(session: AsyncSession, users: list[UserSchema]):
+    token = create_access_token({'sub': str(users[0].id), 'username': users[0].fullname}, timedelta(seconds=-1))
+    with pytest.raises(HTTPException):
+        await authenticate_token(session, token)
+    assert len(claims_cache) == 0
+
+async def test_logger_middleware_shares_verified_payload(users: list[UserSchema]):
+    token = create_access_token({'sub': str(users[0].id), 'username': users[0].fullname})
+    seen = {}
+
+    async def app(scope, receive, send):
+        request = Request(scope)
+        seen['payload'] = await request_token_payload(request, token)
+
+    scope = dict(type='http', headers=[(b'authorization', f'Bearer {token}'.encode())])
+    await LoggerMiddleware(app)(scope, None, None)
+    assert seen['payload'].sub == users[0].id
+    assert _extra.get()['user_id'] == str(users[0].id)
+    # decoded once by the middleware, the dependency reused it
+    assert (claims_cache.hits, claims_cache.misses) == (0, 1)
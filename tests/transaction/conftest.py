@@ -3,11 +3,11 @@ from typing import AsyncGenerator
 import pytest
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from src.transaction.dependencies import get_current_user
 from src.transaction.web import app
-from src.database.connection import get_async_session
+from src.database.connection import get_async_session, get_session_maker
 from src.database.models import User
 from src.schemas import UserSchema
 
@@ -15,6 +15,7 @@ from src.schemas import UserSchema
 @pytest.fixture
 async def client(session: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
     app.dependency_overrides[get_async_session] = lambda: session
+    app.dependency_overrides[get_session_maker] = lambda: async_sessionmaker(bind=session.bind)
     async with AsyncClient(transport=ASGITransport(app=app), base_url='http://127.0.0.1:8000') as ac:
         yield ac
     app.dependency_overrides = {}
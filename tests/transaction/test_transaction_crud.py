@@ -1,17 +1,24 @@
+import asyncio
 import math
 import random
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
 from functools import reduce
 
 import pytest
-from sqlalchemy import select, func, or_, and_
-from sqlalchemy.ext.asyncio import AsyncSession
+from prometheus_client import REGISTRY
+from sqlalchemy import select, func, or_, and_, insert, text, delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import aliased
 
-from src.database.models import Transaction, TransactionStatus, User
-from src.schemas import UserSchema, TransactionSchema
+from src.database.models import Transaction, TransactionStatus, User, UserTransactionCounter
+from src.schemas import UserSchema, TransactionSchema, TransactionCreateSchema
 from src.settings import settings
-from src.transaction.crud import get_transactions, create_transaction, imitate_process_transaction, \
-    get_user_transactions_pagecount
+from src.transaction.crud import get_transactions, create_transaction, create_transactions, imitate_process_transaction, \
+    get_user_transactions_pagecount, build_history_query, build_count_query, count_user_transactions, \
+    claim_transactions
+from src.transaction.utils import HistoryCursor
 
 
 async def test_create_transaction(session: AsyncSession, users: list[UserSchema]):
@@ -33,6 +40,18 @@ async def test_create_transaction(session: AsyncSession, users: list[UserSchema]
     assert res.dt == t.dt
     assert res.status == t.status
 
+async def test_create_transactions(session: AsyncSession, users: list[UserSchema]):
+    items = [
+        TransactionCreateSchema(to_user_id=users[1].id, amount=Decimal(i))
+        for i in range(1, 6)
+    ]
+    created = await create_transactions(session, users[0].id, items)
+    assert len(created) == len(items)
+    amounts = dict((await session.execute(
+        select(Transaction.id, Transaction.amount).where(Transaction.from_user_id == users[0].id)
+    )).all())
+    assert [amounts[t.id] for t in created] == [item.amount for item in items]
+
 async def test_get_transactions_return_all_records_in_decreasing_order(
         session: AsyncSession,
         users: list[UserSchema],
@@ -91,7 +110,7 @@ async def test_get_transactions_can_filter_by_status(
         user_tr = await get_transactions(session, user.id, status=status)
         assert expected_transactions_count == len(user_tr)
         for i in range(len(user_tr)):
-            assert user_tr[i][-1] == status
+            assert user_tr[i].status == status
 
 async def test_get_transactions_can_paginate(
         session: AsyncSession,
@@ -115,6 +134,77 @@ async def test_get_transactions_can_paginate(
             assert user_tr[i].amount == abs(result[2])
             assert user_tr[i].status == result[3]
 
+async def test_get_transactions_cursor_walks_all_records(
+        session: AsyncSession,
+        users: list[UserSchema],
+        transactions: list[TransactionSchema],
+        monkeypatch
+):
+    monkeypatch.setattr(settings, 'RECORDS_IN_PAGE', 3)
+    # self transfer gives two rows with the same (dt, id)
+    session.add(
+        Transaction(
+            id=len(transactions) + 1,
+            dt=transactions[0].dt,
+            from_user_id=users[0].id,
+            to_user_id=users[0].id,
+            amount=1,
+            status=TransactionStatus.DONE
+        )
+    )
+    await session.commit()
+    for user in users:
+        expected = await get_transactions(session, user.id)
+        walked = list(await get_transactions(session, user.id, page=1))
+        while len(walked) % settings.RECORDS_IN_PAGE == 0:
+            cursor = HistoryCursor.from_row(walked[-1])
+            page = await get_transactions(session, user.id, cursor=cursor)
+            if not page:
+                break
+            walked.extend(page)
+        assert [(r.id, r.direction) for r in expected] == [(r.id, r.direction) for r in walked]
+
+def test_history_cursor_encode_decode():
+    cursor = HistoryCursor(dt=datetime(2024, 12, 22, 13, 45, 1, 123), id=10, direction='income')
+    assert HistoryCursor.decode(cursor.encode()) == cursor
+    for bad in ('', 'abc', cursor.encode()[:-2]):
+        with pytest.raises(ValueError):
+            HistoryCursor.decode(bad)
+
+async def test_get_transactions_uses_history_indexes(session: AsyncSession):
+    users = [
+        User(id=uuid.uuid4(), fullname=f'user {i}', hashed_password='', balance=0)
+        for i in range(100)
+    ]
+    session.add_all(users)
+    await session.flush()
+    now = datetime.now()
+    await session.execute(
+        insert(Transaction),
+        [
+            dict(
+                dt=now - timedelta(minutes=i),
+                from_user_id=users[i % 100].id,
+                to_user_id=users[(i * 7 + 1) % 100].id,
+                amount=1,
+                status=TransactionStatus.DONE
+            )
+            for i in range(20000)
+        ]
+    )
+    await session.execute(text('ANALYZE transactions'))
+    for stmt in (
+        build_history_query(users[0].id, page=1),
+        build_history_query(users[0].id, page=5),
+        build_count_query(users[0].id),
+        build_count_query(users[0].id, dt_start=now.date(), status=TransactionStatus.DONE),
+    ):
+        query = stmt.compile(dialect=session.bind.dialect, compile_kwargs={'literal_binds': True})
+        plan = '\n'.join((await session.scalars(text(f'EXPLAIN {query}'))).all())
+        assert 'Seq Scan on transactions' not in plan
+        assert 'ix_transactions_from_user_id_dt' in plan
+        assert 'ix_transactions_to_user_id_dt' in plan
+
 async def test_imitate_process_transaction_done(
         session: AsyncSession, users: list[UserSchema]):
     transaction = await create_transaction(session, users[0].id, users[1].id, users[0].balance)
@@ -133,6 +223,19 @@ async def test_imitate_process_transaction_done(
     ).first()
     assert all(right)
 
+async def test_imitate_process_transaction_observes_status_dwell(
+        session: AsyncSession, users: list[UserSchema]):
+    def dwell_count(st: TransactionStatus) -> float:
+        return REGISTRY.get_sample_value('transaction_status_dwell_seconds_count', {'status': st.name}) or 0
+
+    before = dwell_count(TransactionStatus.CREATED), dwell_count(TransactionStatus.PROCESSED)
+    transaction = await create_transaction(session, users[0].id, users[1].id, Decimal(1))
+    assert await claim_transactions(session, 1, timedelta(minutes=1)) == [transaction.id]
+    await imitate_process_transaction(session, transaction.id)
+    assert (dwell_count(TransactionStatus.CREATED), dwell_count(TransactionStatus.PROCESSED)) == (
+        before[0] + 1, before[1] + 1
+    )
+
 async def test_imitate_process_transaction_canceled(
         session: AsyncSession, users: list[UserSchema]):
     transaction = await create_transaction(session, users[0].id, users[1].id, users[0].balance + 1)
@@ -151,6 +254,101 @@ async def test_imitate_process_transaction_canceled(
     ).first()
     assert all(right)
 
+async def test_imitate_process_transaction_concurrent_transfers_keep_balances_consistent(engine):
+    start_balance = Decimal('100.00')
+    users = [
+        User(id=uuid.uuid4(), fullname=f'stress {i} {uuid.uuid4()}', hashed_password='', balance=start_balance)
+        for i in range(4)
+    ]
+    SessionMaker = async_sessionmaker(engine, expire_on_commit=False)
+    async with SessionMaker() as session:
+        session.add_all(users)
+        await session.commit()
+        t_ids = (await session.scalars(
+            insert(Transaction).returning(Transaction.id),
+            [
+                dict(
+                    from_user_id=f.id,
+                    to_user_id=t.id,
+                    amount=Decimal(random.randrange(1, 3000)) / 100,
+                    status=TransactionStatus.CREATED
+                )
+                for f, t in (random.choices(users, k=2) for _ in range(300))
+            ]
+        )).all()
+        await session.commit()
+
+    semaphore = asyncio.Semaphore(30)
+    async def settle(t_id: int):
+        async with semaphore, SessionMaker() as s:
+            return await imitate_process_transaction(s, t_id)
+
+    try:
+        statuses = await asyncio.gather(*map(settle, t_ids))
+        assert set(statuses) <= {TransactionStatus.DONE, TransactionStatus.CANCELED}
+        async with SessionMaker() as session:
+            balances = dict((await session.execute(
+                select(User.id, User.balance).where(User.id.in_([u.id for u in users]))
+            )).all())
+            done = (await session.execute(
+                select(Transaction.from_user_id, Transaction.to_user_id, Transaction.amount)
+                .where(Transaction.id.in_(t_ids), Transaction.status == TransactionStatus.DONE)
+            )).all()
+            # settling an already settled transaction changes nothing
+            assert await imitate_process_transaction(session, t_ids[0]) is None
+        assert sum(balances.values()) == start_balance * len(users)
+        assert all(b >= 0 for b in balances.values())
+        expected = {u.id: start_balance for u in users}
+        for f, t, amount in done:
+            expected[f] -= amount
+            expected[t] += amount
+        assert expected == balances
+    finally:
+        async with SessionMaker() as session:
+            await session.execute(delete(Transaction).where(Transaction.id.in_(t_ids)))
+            await session.execute(delete(User).where(User.id.in_([u.id for u in users])))
+            await session.commit()
+
+async def test_user_transaction_counters_follow_writes(session: AsyncSession, users: list[UserSchema]):
+    u1, u2 = users
+    done = await create_transaction(session, u1.id, u2.id, Decimal(1))
+    await create_transactions(
+        session, u1.id, [TransactionCreateSchema(to_user_id=u2.id, amount=Decimal(i)) for i in range(1, 4)]
+    )
+    await create_transaction(session, u2.id, u1.id, u2.balance * 10)
+    await imitate_process_transaction(session, done.id)
+    counters = {
+        c.user_id: (c.outgoing, c.incoming, c.created, c.processed, c.done, c.canceled)
+        for c in (await session.scalars(select(UserTransactionCounter))).all()
+    }
+    assert counters == {u1.id: (4, 1, 4, 0, 1, 0), u2.id: (1, 4, 4, 0, 1, 0)}
+    await session.execute(delete(Transaction).where(Transaction.id == done.id))
+    assert await session.scalar(
+        select(UserTransactionCounter.outgoing).where(UserTransactionCounter.user_id == u1.id)
+    ) == 3
+
+async def test_get_user_transactions_pagecount_from_counters(session: AsyncSession, users: list[UserSchema]):
+    await session.execute(
+        insert(Transaction),
+        [dict(from_user_id=users[0].id, to_user_id=users[1].id, amount=1)] * (settings.RECORDS_IN_PAGE + 1)
+    )
+    assert await get_user_transactions_pagecount(session, users[0].id) == 2
+    assert await get_user_transactions_pagecount(session, uuid.uuid4()) == 0
+
+async def test_count_user_transactions_with_filters(
+        session: AsyncSession, users: list[UserSchema], transactions: list[TransactionSchema]
+):
+    dt_start = sorted(t.dt for t in transactions)[len(transactions) // 2]
+    for user in users:
+        for st in (None, *TransactionStatus):
+            exp = sum(
+                user.id in (t.from_user_id, t.to_user_id) and (st is None or t.status == st) and t.dt >= dt_start
+                for t in transactions
+            )
+            assert await count_user_transactions(session, user.id, dt_start=dt_start, status=st) == exp
+        estimate = await count_user_transactions(session, user.id, dt_start=dt_start, approximate=True)
+        assert isinstance(estimate, int)
+
 async def test_get_user_transactions_pagecount(
         session: AsyncSession, users: list[UserSchema], transactions: list[TransactionSchema]
 ):
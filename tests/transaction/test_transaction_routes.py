@@ -1,10 +1,15 @@
+import csv
+import json
 import math
+import uuid
+from datetime import timedelta
 from functools import reduce
 
 from httpx import AsyncClient
+from sqlalchemy import update
 from starlette import status
 
-from src.database.models import TransactionStatus
+from src.database.models import TransactionStatus, Transaction
 from src.schemas import UserSchema, TransactionCreateSchema, TransactionSchema, TransactonHistoryParamsSchema
 from src.settings import settings
 
@@ -23,6 +28,27 @@ async def test_create_transaction_return_403(client_u1: AsyncClient, users: list
     responce = await client_u1.post('/transaction/create', json=data)
     assert status.HTTP_403_FORBIDDEN == responce.status_code
 
+async def test_create_transactions_batch(client_u1: AsyncClient, users: list[UserSchema]):
+    amount = users[0].balance / 4
+    data = [
+        dict(to_user_id=str(users[1].id), amount=str(amount)),
+        dict(to_user_id=str(uuid.uuid4()), amount=str(amount)),
+        dict(to_user_id=str(users[1].id), amount=str(amount * 3)),
+        dict(to_user_id=str(users[1].id), amount=str(amount * 4)),
+    ]
+    responce = await client_u1.post('/transaction/batch', json=data)
+    assert status.HTTP_201_CREATED == responce.status_code
+    jsn = responce.json()
+    assert [r['error'] for r in jsn] == [None, 'Recipient not found', None, 'Insufficient funds']
+    created = [r['transaction'] for r in jsn if r['transaction'] is not None]
+    assert len(created) == 2
+    assert created[0]['id'] < created[1]['id']
+    assert all(t['status'] == TransactionStatus.CREATED for t in created)
+
+async def test_create_transactions_batch_return_422_for_empty_batch(client_u1: AsyncClient):
+    responce = await client_u1.post('/transaction/batch', json=[])
+    assert status.HTTP_422_UNPROCESSABLE_ENTITY == responce.status_code
+
 async def test_get_user_transactions_pagescount(
         client_u1: AsyncClient,
         users: list[UserSchema],
@@ -40,6 +66,27 @@ async def test_get_user_transactions_pagescount(
     )
     assert exp == jsn['pages_count']
 
+async def test_get_user_transactions_pagescount_with_filters(
+        client_u1: AsyncClient,
+        users: list[UserSchema],
+        transactions: list[TransactionSchema],
+        monkeypatch
+):
+    monkeypatch.setattr(settings, 'RECORDS_IN_PAGE', 1)
+    today = min(t.dt for t in transactions).date()
+    for st in TransactionStatus:
+        for params in (dict(status=st.value), dict(status=st.value, dt_start=str(today))):
+            result = await client_u1.get('/transaction/pagescount', params=params)
+            assert status.HTTP_200_OK == result.status_code
+            exp = sum(
+                t.status == st and users[0].id in (t.from_user_id, t.to_user_id) and t.dt.date() >= today
+                for t in transactions
+            )
+            assert result.json() == dict(pages_count=exp, approximate=False)
+    result = await client_u1.get('/transaction/pagescount', params=dict(dt_start=str(today), approximate=True))
+    assert result.json()['approximate'] is True
+    assert result.json()['pages_count'] >= 0
+
 async def test_get_user_transaction_history(
         client_u1: AsyncClient,
         users: list[UserSchema],
@@ -67,3 +114,118 @@ async def test_get_user_transaction_history(
             else:
                 break
     assert cnt == len(result.json())
+
+
+async def test_get_user_transaction_history_by_cursor(
+        client_u1: AsyncClient,
+        users: list[UserSchema],
+        transactions: list[TransactionSchema],
+        monkeypatch
+):
+    monkeypatch.setattr(settings, 'RECORDS_IN_PAGE', 2)
+    expected = [
+        t.id for t in sorted(transactions, key=lambda t: t.dt, reverse=True)
+        if users[0].id in (t.from_user_id, t.to_user_id)
+    ]
+    result = await client_u1.get('/transaction/history')
+    received = result.json()
+    while 'X-Next-Cursor' in result.headers:
+        result = await client_u1.get('/transaction/history', params=dict(cursor=result.headers['X-Next-Cursor']))
+        assert status.HTTP_200_OK == result.status_code
+        received.extend(result.json())
+    assert len(expected) == len(received)
+    assert result.headers['X-Has-Next'] == 'false'
+
+async def test_get_user_transaction_history_has_next(
+        client_u1: AsyncClient, users: list[UserSchema], transactions: list[TransactionSchema], monkeypatch
+):
+    total = sum(users[0].id in (t.from_user_id, t.to_user_id) for t in transactions)
+    monkeypatch.setattr(settings, 'RECORDS_IN_PAGE', total)
+    result = await client_u1.get('/transaction/history')
+    assert len(result.json()) == total
+    assert result.headers['X-Has-Next'] == 'false'
+    assert 'X-Next-Cursor' not in result.headers
+    monkeypatch.setattr(settings, 'RECORDS_IN_PAGE', total - 1)
+    result = await client_u1.get('/transaction/history')
+    assert len(result.json()) == total - 1
+    assert result.headers['X-Has-Next'] == 'true'
+    result = await client_u1.get('/transaction/history', params=dict(cursor=result.headers['X-Next-Cursor']))
+    assert len(result.json()) == 1
+    assert result.headers['X-Has-Next'] == 'false'
+
+async def test_get_user_transaction_history_bad_cursor_return_400(client_u1: AsyncClient):
+    result = await client_u1.get('/transaction/history', params=dict(cursor='bad'))
+    assert status.HTTP_400_BAD_REQUEST == result.status_code
+
+
+async def test_export_user_transaction_history(
+        client_u1: AsyncClient,
+        users: list[UserSchema],
+        transactions: list[TransactionSchema],
+        monkeypatch
+):
+    monkeypatch.setattr(settings, 'EXPORT_CHUNK_SIZE', 2)
+    expected = sum(users[0].id in (t.from_user_id, t.to_user_id) for t in transactions)
+    result = await client_u1.get('/transaction/history/export')
+    assert status.HTTP_200_OK == result.status_code
+    assert result.headers['content-type'].startswith('application/x-ndjson')
+    records = [json.loads(line) for line in result.text.splitlines()]
+    assert expected == len(records)
+    assert sorted(records, key=lambda r: r['date'], reverse=True) == records
+
+    result = await client_u1.get('/transaction/history/export', params=dict(format='csv'))
+    assert status.HTTP_200_OK == result.status_code
+    assert result.headers['content-type'].startswith('text/csv')
+    rows = list(csv.DictReader(result.text.splitlines()))
+    assert [r['amount'] for r in rows] == [r['amount'] for r in records]
+
+async def test_export_user_transaction_history_can_filter_by_status(
+        client_u1: AsyncClient,
+        users: list[UserSchema],
+        transactions: list[TransactionSchema],
+):
+    expected = sum(
+        users[0].id in (t.from_user_id, t.to_user_id) and t.status == TransactionStatus.DONE
+        for t in transactions
+    )
+    result = await client_u1.get('/transaction/history/export', params=dict(status=TransactionStatus.DONE.value))
+    assert status.HTTP_200_OK == result.status_code
+    assert expected == len(result.text.splitlines())
+
+async def test_get_metrics(client_u1: AsyncClient):
+    await client_u1.get('/transaction/history')
+    result = await client_u1.get('/metrics')
+    assert status.HTTP_200_OK == result.status_code
+    assert result.headers['content-type'].startswith('text/plain')
+    assert 'http_request_duration_seconds_count{method="GET",route="/transaction/history",status="200"}' in result.text
+    for name in ('db_pool_connections', 'settlement_queue_size', 'auth_cache_hits_total', 'password_hash_in_flight'):
+        assert name in result.text
+
+async def test_get_auth_cache_stats(client: AsyncClient):
+    result = await client.get('/stats/auth-cache')
+    assert status.HTTP_200_OK == result.status_code
+    assert set(result.json()) == {'claims', 'principal'}
+
+async def test_export_user_transaction_history_can_filter_by_date(
+        client_u1: AsyncClient,
+        session,
+        users: list[UserSchema],
+        transactions: list[TransactionSchema],
+):
+    # move the oldest transaction two days back so that a date filter has something to drop
+    old = transactions[-1]
+    await session.execute(
+        update(Transaction).values(dt=old.dt - timedelta(days=2)).where(Transaction.id == old.id)
+    )
+    await session.commit()
+    today = transactions[0].dt.date()
+    expected = sum(
+        users[0].id in (t.from_user_id, t.to_user_id) and t.id != old.id
+        for t in transactions
+    )
+    params = dict(dt_start=str(today - timedelta(days=1)), dt_end=str(today))
+    result = await client_u1.get('/transaction/history/export', params=params)
+    assert status.HTTP_200_OK == result.status_code
+    assert expected == len(result.text.splitlines())
+    result = await client_u1.get('/transaction/history/export', params=dict(dt_end=str(today - timedelta(days=2))))
+    assert int(users[0].id in (old.from_user_id, old.to_user_id)) == len(result.text.splitlines())
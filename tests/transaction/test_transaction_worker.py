@@ -0,0 +1,106 @@
+import asyncio
+import uuid
+from datetime import timedelta, datetime
+from decimal import Decimal
+
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.database.models import Transaction, TransactionStatus, User
+from src.schemas import UserSchema
+from src.transaction.crud import claim_transactions
+from src.transaction.worker import SettlementWorker
+
+
+async def test_claim_transactions(session: AsyncSession, users: list[UserSchema]):
+    t_ids = (await session.scalars(
+        insert(Transaction).returning(Transaction.id),
+        [dict(from_user_id=users[0].id, to_user_id=users[1].id, amount=1) for _ in range(3)]
+    )).all()
+    await session.commit()
+    lease = timedelta(minutes=1)
+    claimed = await claim_transactions(session, 2, lease)
+    assert claimed == t_ids[:2]
+    assert await claim_transactions(session, 2, lease) == t_ids[2:]
+    assert await claim_transactions(session, 2, lease) == []
+    statuses = (await session.scalars(
+        select(Transaction.status).where(Transaction.id.in_(t_ids), Transaction.claimed_at.is_not(None))
+    )).all()
+    assert statuses == [TransactionStatus.PROCESSED] * 3
+    # the worker which claimed the first one has died
+    await session.execute(
+        update(Transaction)
+        .values(claimed_at=datetime.now() - 2 * lease)
+        .where(Transaction.id == t_ids[0])
+    )
+    assert await claim_transactions(session, 2, lease) == t_ids[:1]
+
+async def test_claim_transactions_reclaims_processed_without_claim_time(
+        session: AsyncSession, users: list[UserSchema]):
+    t_id = await session.scalar(
+        insert(Transaction)
+        .values(from_user_id=users[0].id, to_user_id=users[1].id, amount=1, status=TransactionStatus.PROCESSED)
+        .returning(Transaction.id)
+    )
+    await session.commit()
+    assert await claim_transactions(session, 2, timedelta(minutes=1)) == [t_id]
+    assert await session.scalar(select(Transaction.claimed_at).where(Transaction.id == t_id)) is not None
+
+async def test_settlement_workers_share_backlog(engine):
+    users = [
+        User(id=uuid.uuid4(), fullname=f'worker {i} {uuid.uuid4()}', hashed_password='', balance=Decimal(100))
+        for i in range(3)
+    ]
+    SessionMaker = async_sessionmaker(engine, expire_on_commit=False)
+    async with SessionMaker() as session:
+        session.add_all(users)
+        await session.commit()
+        t_ids = (await session.scalars(
+            insert(Transaction).returning(Transaction.id),
+            [
+                dict(from_user_id=users[i % 3].id, to_user_id=users[(i + 1) % 3].id, amount=Decimal(i))
+                for i in range(1, 61)
+            ]
+        )).all()
+        await session.commit()
+    # two replicas of the service
+    workers = [
+        SettlementWorker(SessionMaker, concurrency=3, batch_size=5, poll_interval=0.05, lease=timedelta(minutes=1))
+        for _ in range(2)
+    ]
+    try:
+        for worker in workers:
+            await worker.start()
+        async with SessionMaker() as session:
+            for _ in range(200):
+                pending = await session.scalar(
+                    select(Transaction.id)
+                    .where(
+                        Transaction.id.in_(t_ids),
+                        Transaction.status.in_((TransactionStatus.CREATED, TransactionStatus.PROCESSED))
+                    )
+                    .limit(1)
+                )
+                await session.commit()
+                if pending is None:
+                    break
+                await asyncio.sleep(0.05)
+        for worker in workers:
+            await worker.stop(timeout=5)
+        assert sum(worker.settled for worker in workers) == len(t_ids)
+        async with SessionMaker() as session:
+            statuses = set((await session.scalars(
+                select(Transaction.status).where(Transaction.id.in_(t_ids))
+            )).all())
+            balances = (await session.scalars(
+                select(User.balance).where(User.id.in_([u.id for u in users]))
+            )).all()
+        assert statuses <= {TransactionStatus.DONE, TransactionStatus.CANCELED}
+        assert sum(balances) == 300
+    finally:
+        for worker in workers:
+            await worker.stop(timeout=0)
+        async with SessionMaker() as session:
+            await session.execute(delete(Transaction).where(Transaction.id.in_(t_ids)))
+            await session.execute(delete(User).where(User.id.in_([u.id for u in users])))
+            await session.commit()